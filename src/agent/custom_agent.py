@@ -1,15 +1,14 @@
 import base64
 import io
-import json
 import logging
 import os
 import pdb
 import platform
+import time
 import traceback
 from shlex import join
 from typing import Any, Callable, Dict, List, Optional, Type
 
-from json_repair import repair_json
 from langchain_core.language_models.chat_models import BaseChatModel
 from langchain_core.messages import BaseMessage
 from PIL import Image, ImageDraw, ImageFont
@@ -26,7 +25,11 @@ from browser_use.telemetry.views import (AgentEndTelemetryEvent,
                                          AgentRunTelemetryEvent,
                                          AgentStepTelemetryEvent)
 from browser_use.utils import time_execution_async
+from src.browser.custom_context import CustomBrowserContext
+from src.controller.custom_controller import PAGE_CONTENT_MARKERS
 from src.utils.agent_state import AgentState
+from src.utils.cpu_pool import get_cpu_pool
+from src.utils.utils import arepair_json_loads
 
 from .custom_massage_manager import CustomMassageManager
 from .custom_views import CustomAgentOutput, CustomAgentStepInfo
@@ -72,6 +75,8 @@ class CustomAgent(Agent):
             register_new_step_callback: Callable[['BrowserState', 'AgentOutput', int], None] | None = None,
             register_done_callback: Callable[['AgentHistoryList'], None] | None = None,
             tool_calling_method: Optional[str] = 'auto',
+            step_budget_callback: Callable[[int, list[ActionResult], str], int] | None = None,
+            llm_latency_callback: Callable[[float], None] | None = None,
     ):
         super().__init__(
             task=task,
@@ -111,6 +116,10 @@ class CustomAgent(Agent):
         self.add_infos = add_infos
         # agent_state for Stop
         self.agent_state = agent_state
+        # (steps taken, last step results, memory) -> total steps allowed, can end the run early or extend it
+        self.step_budget_callback = step_budget_callback
+        # seconds each next action call took, e.g. for a scheduler watching the LLM load
+        self.llm_latency_callback = llm_latency_callback
         self.agent_prompt_class = agent_prompt_class
         self.message_manager = CustomMassageManager(
             llm=self.llm,
@@ -193,7 +202,11 @@ class CustomAgent(Agent):
             else input_messages
         )
 
-        ai_message = self.llm.invoke(messages_to_process)
+        # async call, the other agents of the loop keep running while this one waits for the model
+        start = time.perf_counter()
+        ai_message = await self.llm.ainvoke(messages_to_process)
+        if self.llm_latency_callback:
+            self.llm_latency_callback(time.perf_counter() - start)
         self.message_manager._add_message_with_tokens(ai_message)
 
         if self.use_deepseek_r1:
@@ -207,8 +220,7 @@ class CustomAgent(Agent):
             ai_content = ai_message.content
 
         ai_content = ai_content.replace("```json", "").replace("```", "")
-        ai_content = repair_json(ai_content)
-        parsed_json = json.loads(ai_content)
+        parsed_json = await arepair_json_loads(ai_content)
         parsed: AgentOutput = self.AgentOutput(**parsed_json)
         
         if parsed is None:
@@ -232,6 +244,9 @@ class CustomAgent(Agent):
 
         try:
             state = await self.browser_context.get_state(use_vision=self.use_vision)
+            if self.agent_state:
+                # the step state doubles as the last valid state, no second capture needed
+                self.agent_state.set_last_valid_state(state)
             self.message_manager.add_state_message(state, self._last_actions, self._last_result, step_info)
             input_messages = self.message_manager.get_messages()
             try:
@@ -265,7 +280,7 @@ class CustomAgent(Agent):
                 # TODO: fix no action case
                 result = [ActionResult(is_done=True, extracted_content=step_info.memory, include_in_memory=True)]
             for ret_ in result:
-                if "Extracted page" in ret_.extracted_content:
+                if ret_.extracted_content and any(marker in ret_.extracted_content for marker in PAGE_CONTENT_MARKERS):
                     # record every extracted page
                     self.extracted_content += ret_.extracted_content
             self._last_result = result
@@ -319,33 +334,34 @@ class CustomAgent(Agent):
                 future_plans=""
             )
 
-            for step in range(max_steps):
+            step = 0
+            while step < max_steps:
                 # 1) Check if stop requested
                 if self.agent_state and self.agent_state.is_stop_requested():
                     logger.info("🛑 Stop requested by user")
                     self._create_stop_history_item()
                     break
 
-                # 2) Store last valid state before step
-                if self.browser_context and self.agent_state:
-                    state = await self.browser_context.get_state(use_vision=self.use_vision)
-                    self.agent_state.set_last_valid_state(state)
-
                 if self._too_many_failures():
                     break
 
-                # 3) Do the step
+                # 2) Do the step, it stores the last valid state
                 await self.step(step_info)
+                step += 1
 
                 if self.history.is_done():
                     if (
-                            self.validate_output and step < max_steps - 1
+                            self.validate_output and step < max_steps
                     ):  # if last step, we dont need to validate
                         if not await self._validate_output():
                             continue
 
                     logger.info("✅ Task completed successfully")
                     break
+
+                if self.step_budget_callback:
+                    max_steps = self.step_budget_callback(step, self._last_result, step_info.memory)
+                    step_info.max_steps = max_steps
             else:
                 logger.info("❌ Failed to complete task in maximum steps")
                 if not self.extracted_content:
@@ -353,6 +369,10 @@ class CustomAgent(Agent):
                 else:
                     self.history.history[-1].result[-1].extracted_content = self.extracted_content
 
+            if self.history.is_done() and isinstance(self.browser_context, CustomBrowserContext):
+                # keep the logins of a successful run for the next contexts of the same sites
+                await self.browser_context.save_storage_state()
+
             return self.history
 
         finally:
@@ -377,7 +397,8 @@ class CustomAgent(Agent):
                 if isinstance(self.generate_gif, str):
                     output_path = self.generate_gif
 
-                self.create_history_gif(output_path=output_path)
+                # PIL drawing and gif encoding release the GIL, keep them off the event loop
+                await get_cpu_pool().run_in_thread(self.create_history_gif, output_path=output_path)
 
     def _create_stop_history_item(self):
         """Create a history item for when the agent is stopped."""
@@ -0,0 +1,203 @@
+import asyncio
+import logging
+import time
+import uuid
+from collections import deque
+from dataclasses import dataclass
+from typing import Dict, Optional
+
+from browser_use.browser.context import BrowserContextConfig
+
+from .custom_browser import CustomBrowser
+from .custom_context import CustomBrowserContext
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass
+class ContextPoolStats:
+    acquires: int = 0
+    hits: int = 0
+    misses: int = 0
+    total_acquire_ms: float = 0.0
+    recycled: int = 0
+
+    @property
+    def hit_rate(self) -> float:
+        return self.hits / self.acquires if self.acquires else 0.0
+
+    @property
+    def avg_acquire_ms(self) -> float:
+        return self.total_acquire_ms / self.acquires if self.acquires else 0.0
+
+    def as_dict(self) -> dict:
+        return {
+            "acquires": self.acquires,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hit_rate, 3),
+            "avg_acquire_ms": round(self.avg_acquire_ms, 2),
+            "recycled": self.recycled,
+        }
+
+
+class CustomBrowserContextPool:
+    """
+    Keeps `size` warmed CustomBrowserContexts (session initialized, blank page loaded)
+    ready to be handed out to agents. Released contexts are reset and put back,
+    or kept as-is when released for a tenant.
+    """
+
+    def __init__(
+            self,
+            browser: CustomBrowser,
+            config: Optional[BrowserContextConfig] = None,
+            size: int = 2,
+            max_uses: int = 10,
+    ):
+        self.browser = browser
+        self.config = config or browser.config.new_context_config
+        # contexts attached to an existing chrome instance share `contexts[0]`, never pool them
+        if browser.config.chrome_instance_path or browser.config.cdp_url:
+            size = 0
+        self.size = size
+        self.max_uses = max_uses
+        self.stats = ContextPoolStats()
+        self._idle: deque[CustomBrowserContext] = deque()
+        self._tenants: Dict[str, CustomBrowserContext] = {}
+        self._uses: Dict[str, int] = {}
+        self._warming: set[asyncio.Task] = set()
+        self._closed = False
+
+    async def _create_warm_context(self) -> CustomBrowserContext:
+        context = await self.browser.new_context(config=self.config)
+        # initializes the playwright context with a blank page and the config applied
+        await context.get_session()
+        self._uses[context.context_id] = 0
+        return context
+
+    async def _warm_one(self):
+        try:
+            context = await self._create_warm_context()
+        except Exception as e:
+            logger.warning(f"Failed to warm browser context: {e}")
+            return
+        if self._closed:
+            await context.close()
+            return
+        self._idle.append(context)
+
+    def _schedule_refill(self):
+        missing = self.size - len(self._idle) - len(self._warming)
+        for _ in range(max(missing, 0)):
+            task = asyncio.create_task(self._warm_one())
+            self._warming.add(task)
+            task.add_done_callback(self._warming.discard)
+
+    async def warm(self):
+        """Fill the pool up to `size` idle contexts and wait until they are ready"""
+        self._schedule_refill()
+        if self._warming:
+            await asyncio.gather(*self._warming, return_exceptions=True)
+
+    async def acquire(self, tenant: Optional[str] = None) -> CustomBrowserContext:
+        """Hand out a warmed context, creating one on a pool miss"""
+        if self._closed:
+            raise RuntimeError("Browser context pool is closed")
+        start = time.perf_counter()
+        context = None
+        if tenant is not None and tenant in self._tenants:
+            context = self._tenants.pop(tenant)
+        elif self._idle:
+            context = self._idle.popleft()
+
+        if context is not None:
+            self.stats.hits += 1
+        else:
+            self.stats.misses += 1
+            context = await self._create_warm_context()
+
+        self._uses[context.context_id] = self._uses.get(context.context_id, 0) + 1
+        # a new agent, not the one that used the context before
+        context.visitor_id = str(uuid.uuid4())
+        self.stats.acquires += 1
+        self.stats.total_acquire_ms += (time.perf_counter() - start) * 1000
+        self._schedule_refill()
+        return context
+
+    async def release(self, context: CustomBrowserContext, tenant: Optional[str] = None):
+        """Return a context to the pool. Tenant contexts keep their cookies and storage."""
+        if self._closed or context.session is None:
+            await self._discard(context)
+            return
+
+        if tenant is not None:
+            previous = self._tenants.pop(tenant, None)
+            if previous is not None and previous is not context:
+                await self._discard(previous)
+            self._tenants[tenant] = context
+            return
+
+        if len(self._idle) >= self.size or self._uses.get(context.context_id, 0) >= self.max_uses:
+            self.stats.recycled += 1
+            await self._discard(context)
+            self._schedule_refill()
+            return
+
+        try:
+            await self._reset_context(context)
+        except Exception as e:
+            logger.debug(f"Failed to reset browser context, discarding it: {e}")
+            await self._discard(context)
+            self._schedule_refill()
+            return
+        self._idle.append(context)
+
+    async def _reset_context(self, context: CustomBrowserContext):
+        """
+        Clear cookies and the storage of every origin the previous agent visited, and replace
+        its tabs with one blank page (a new tab also has a fresh sessionStorage)
+        """
+        session = await context.get_session()
+        old_pages = list(session.context.pages)
+        page = await session.context.new_page()
+        origins = {origin["origin"] for origin in (await session.context.storage_state())["origins"]}
+        if isinstance(context, CustomBrowserContext):
+            origins |= context.visited_origins
+        if origins:
+            # localStorage, IndexedDB, cache storage, service workers... of each origin
+            cdp = await session.context.new_cdp_session(page)
+            try:
+                for origin in origins:
+                    await cdp.send("Storage.clearDataForOrigin", {"origin": origin, "storageTypes": "all"})
+            finally:
+                await cdp.detach()
+        for old_page in old_pages:
+            await old_page.close()
+        await session.context.clear_cookies()
+        if isinstance(context, CustomBrowserContext):
+            context.visited_origins.clear()
+            # lean mode counters are reported per agent
+            context.lean_stats.clear()
+            context.clipboard = None
+            await context.restore_storage_cookies()
+        session.current_page = page
+
+    async def _discard(self, context: CustomBrowserContext):
+        self._uses.pop(context.context_id, None)
+        try:
+            await context.close()
+        except Exception as e:
+            logger.debug(f"Failed to close browser context: {e}")
+
+    async def close(self):
+        """Close every idle and tenant context owned by the pool"""
+        self._closed = True
+        for task in list(self._warming):
+            task.cancel()
+        contexts = list(self._idle) + list(self._tenants.values())
+        self._idle.clear()
+        self._tenants.clear()
+        for context in contexts:
+            await self._discard(context)
+        logger.info(f"Browser context pool closed: {self.stats.as_dict()}")
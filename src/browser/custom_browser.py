@@ -9,17 +9,29 @@ from playwright.async_api import (
     Playwright,
     async_playwright,
 )
-from browser_use.browser.browser import Browser
+from typing import Optional
+
+from browser_use.browser.browser import Browser, BrowserConfig
 from browser_use.browser.context import BrowserContext, BrowserContextConfig
 from playwright.async_api import BrowserContext as PlaywrightBrowserContext
 import logging
 
 from .custom_context import CustomBrowserContext
+from .http_cache import SharedHttpCache
 
 logger = logging.getLogger(__name__)
 
 class CustomBrowser(Browser):
 
+    def __init__(
+        self,
+        config: BrowserConfig = BrowserConfig(),
+        http_cache: Optional[SharedHttpCache] = None,
+    ):
+        super().__init__(config=config)
+        # response cache consulted by every context created from this browser
+        self.http_cache = http_cache
+
     async def new_context(
         self,
         config: BrowserContextConfig = BrowserContextConfig()
@@ -1,14 +1,85 @@
 import json
 import logging
 import os
+from dataclasses import dataclass, field, fields
+from urllib.parse import urlparse
 
 from browser_use.browser.browser import Browser
 from browser_use.browser.context import BrowserContext, BrowserContextConfig
 from playwright.async_api import Browser as PlaywrightBrowser
 from playwright.async_api import BrowserContext as PlaywrightBrowserContext
+from playwright.async_api import Frame, Page, Route
+
+from browser_use.browser.views import BrowserState
+
+from .frame_bus import FrameBus
+from .storage_state import StorageStateCache
 
 logger = logging.getLogger(__name__)
 
+# rough median transfer sizes per request (HTTP Archive), used to estimate bytes saved by blocking
+ESTIMATED_RESOURCE_BYTES = {
+    "image": 15_000,
+    "media": 250_000,
+    "font": 30_000,
+    "stylesheet": 20_000,
+    "script": 25_000,
+    "xhr": 3_000,
+    "fetch": 3_000,
+    "other": 5_000,
+}
+
+DEFAULT_BLOCKED_DOMAINS = [
+    "doubleclick.net",
+    "googlesyndication.com",
+    "googletagmanager.com",
+    "google-analytics.com",
+    "googleadservices.com",
+    "adservice.google.com",
+    "facebook.net",
+    "connect.facebook.net",
+    "hotjar.com",
+    "scorecardresearch.com",
+    "criteo.com",
+    "taboola.com",
+    "outbrain.com",
+    "amazon-adsystem.com",
+    "adnxs.com",
+]
+
+
+@dataclass
+class CustomBrowserContextConfig(BrowserContextConfig):
+    """
+    BrowserContextConfig with the options of CustomBrowserContext.
+
+    lean_mode: abort heavy resource types and tracker domains through request routing
+    allow_images: keep images when blocking, set it when the agent uses vision
+    storage_state_account: restore and save cookies/localStorage snapshots of this account
+    """
+    lean_mode: bool = False
+    allow_images: bool = False
+    blocked_resource_types: list[str] = field(default_factory=lambda: ["image", "media", "font"])
+    blocked_domains: list[str] = field(default_factory=lambda: list(DEFAULT_BLOCKED_DOMAINS))
+    storage_state_account: str | None = None
+    storage_state_dir: str = "./tmp/storage_states"
+
+
+@dataclass
+class LeanModeStats:
+    blocked_requests: int = 0
+    allowed_requests: int = 0
+    estimated_bytes_saved: int = 0
+    blocked_by_type: dict[str, int] = field(default_factory=dict)
+
+    def as_dict(self) -> dict:
+        return {
+            "blocked_requests": self.blocked_requests,
+            "allowed_requests": self.allowed_requests,
+            "estimated_bytes_saved": self.estimated_bytes_saved,
+            "blocked_by_type": dict(self.blocked_by_type),
+        }
+
 
 class CustomBrowserContext(BrowserContext):
     def __init__(
@@ -16,4 +87,185 @@ class CustomBrowserContext(BrowserContext):
         browser: "Browser",
         config: BrowserContextConfig = BrowserContextConfig()
     ):
-        super(CustomBrowserContext, self).__init__(browser=browser, config=config)
\ No newline at end of file
+        if not isinstance(config, CustomBrowserContextConfig):
+            config = CustomBrowserContextConfig(
+                **{f.name: getattr(config, f.name) for f in fields(BrowserContextConfig)}
+            )
+        super(CustomBrowserContext, self).__init__(browser=browser, config=config)
+        self.config: CustomBrowserContextConfig
+        self.lean_stats: dict[Page, LeanModeStats] = {}
+        self.frame_bus = FrameBus()
+        # in-memory clipboard of the agent driving this context, see CustomController
+        self.clipboard: str | None = None
+        # pages of this context in opening order, the last one is the fallback when a tab closes
+        self._open_pages: list[Page] = []
+        # tabs being opened by new_background_page, they must not become the current page
+        self._pending_background_pages = 0
+        # identity of the agent driving this context, renewed each time a pool hands it out
+        self.visitor_id: str = self.context_id
+        # origins loaded in any frame, their storage is cleared when a pool reuses the context
+        self.visited_origins: set[str] = set()
+
+    @property
+    def active_page(self) -> Page | None:
+        """O(1) handle of the page the agent works on, None before the session starts"""
+        if self.session is None:
+            return None
+        return self.session.current_page
+
+    def _add_new_page_listener(self, context: PlaywrightBrowserContext):
+        async def on_page(page: Page):
+            # also fires for popups and for the initial page of the session
+            background = self._pending_background_pages > 0
+            if background:
+                self._pending_background_pages -= 1
+            self._open_pages.append(page)
+            page.on("close", self._on_page_close)
+            page.on("framenavigated", self._on_frame_navigated)
+            await page.wait_for_load_state()
+            logger.debug(f"New page opened: {page.url}")
+            if self.session is not None and not page.is_closed() and not background:
+                self.session.current_page = page
+
+        context.on("page", on_page)
+
+    async def new_background_page(self) -> Page:
+        """Open a tab that does not take over the agent's current page"""
+        session = await self.get_session()
+        self._pending_background_pages += 1
+        try:
+            return await session.context.new_page()
+        except Exception:
+            self._pending_background_pages -= 1
+            raise
+
+    def _on_frame_navigated(self, frame: Frame):
+        parts = urlparse(frame.url)
+        if parts.scheme in ("http", "https"):
+            self.visited_origins.add(f"{parts.scheme}://{parts.netloc}")
+
+    def _on_page_close(self, page: Page):
+        if page in self._open_pages:
+            self._open_pages.remove(page)
+        if self.session is not None and self.session.current_page is page and self._open_pages:
+            self.session.current_page = self._open_pages[-1]
+
+    async def get_state(self, use_vision: bool = False) -> BrowserState:
+        state = await super().get_state(use_vision=use_vision)
+        latest_agent_frame = self.frame_bus.latest_agent_frame
+        if state.screenshot and (latest_agent_frame is None or latest_agent_frame.data is not state.screenshot):
+            # share the step screenshot with the live view instead of capturing the page again
+            self.frame_bus.publish(state.screenshot, mime_type="image/png", source=FrameBus.AGENT)
+        return state
+
+    async def _create_context(self, browser: PlaywrightBrowser) -> PlaywrightBrowserContext:
+        context = await super()._create_context(browser)
+        # playwright runs the most recently registered route first: lean blocking, then the cache
+        http_cache = getattr(self.browser, "http_cache", None)
+        if http_cache is not None:
+            await context.route("**/*", http_cache.handle_route)
+        if self.config.lean_mode:
+            await context.route("**/*", self._route_lean_request)
+        if self.config.storage_state_account:
+            await self._restore_storage_state(context)
+        return context
+
+    async def _restore_storage_state(self, context: PlaywrightBrowserContext):
+        cache = StorageStateCache(self.config.storage_state_dir)
+        state = cache.load_all(self.config.storage_state_account)
+        if state["cookies"]:
+            await context.add_cookies(state["cookies"])
+        if state["origins"]:
+            local_storage = {
+                origin["origin"]: [[item["name"], item["value"]] for item in origin["localStorage"]]
+                for origin in state["origins"]
+            }
+            # only fill missing keys so the page's own updates are not overwritten on every navigation
+            await context.add_init_script(
+                f"""
+                (() => {{
+                    const items = {json.dumps(local_storage)}[window.location.origin];
+                    if (!items) return;
+                    try {{
+                        for (const [name, value] of items) {{
+                            if (window.localStorage.getItem(name) === null) window.localStorage.setItem(name, value);
+                        }}
+                    }} catch (e) {{}}
+                }})();
+                """
+            )
+        logger.info(
+            f"Restored storage state ({self.config.storage_state_account}): "
+            f"{len(state['cookies'])} cookies, {len(state['origins'])} origins"
+        )
+
+    async def restore_storage_cookies(self):
+        """Re-add the snapshot cookies, e.g. after the context pool cleared them"""
+        if not self.config.storage_state_account or self.session is None:
+            return
+        state = StorageStateCache(self.config.storage_state_dir).load_all(self.config.storage_state_account)
+        if state["cookies"]:
+            await self.session.context.add_cookies(state["cookies"])
+
+    async def save_storage_state(self) -> list[str]:
+        """Snapshot cookies and localStorage per site, call it after a successful run"""
+        if not self.config.storage_state_account or self.session is None:
+            return []
+        try:
+            storage_state = await self.session.context.storage_state()
+        except Exception as e:
+            logger.warning(f"Failed to read storage state: {e}")
+            return []
+        cache = StorageStateCache(self.config.storage_state_dir)
+        return cache.save(storage_state, self.config.storage_state_account)
+
+    def _is_blocked_domain(self, url: str) -> bool:
+        host = urlparse(url).hostname or ""
+        return any(host == domain or host.endswith("." + domain) for domain in self.config.blocked_domains)
+
+    def _should_block(self, resource_type: str, url: str) -> bool:
+        if url.startswith("data:"):
+            return False
+        if resource_type == "image" and self.config.allow_images:
+            return False
+        if resource_type in self.config.blocked_resource_types:
+            return True
+        return self._is_blocked_domain(url)
+
+    def _page_stats(self, route: Route) -> LeanModeStats:
+        try:
+            page = route.request.frame.page
+        except Exception:
+            # service worker requests have no page
+            page = None
+        if page not in self.lean_stats:
+            self.lean_stats[page] = LeanModeStats()
+        return self.lean_stats[page]
+
+    async def _route_lean_request(self, route: Route):
+        request = route.request
+        stats = self._page_stats(route)
+        if self._should_block(request.resource_type, request.url):
+            stats.blocked_requests += 1
+            stats.blocked_by_type[request.resource_type] = stats.blocked_by_type.get(request.resource_type, 0) + 1
+            stats.estimated_bytes_saved += ESTIMATED_RESOURCE_BYTES.get(
+                request.resource_type, ESTIMATED_RESOURCE_BYTES["other"]
+            )
+            await route.abort("blockedbyclient")
+        else:
+            stats.allowed_requests += 1
+            await route.fallback()
+
+    def get_lean_stats(self) -> dict[str, dict]:
+        """Lean mode counters per page (keyed by url) plus a `total` entry"""
+        total = LeanModeStats()
+        per_page = {}
+        for page, stats in self.lean_stats.items():
+            per_page[page.url if page is not None else "service_worker"] = stats.as_dict()
+            total.blocked_requests += stats.blocked_requests
+            total.allowed_requests += stats.allowed_requests
+            total.estimated_bytes_saved += stats.estimated_bytes_saved
+            for resource_type, count in stats.blocked_by_type.items():
+                total.blocked_by_type[resource_type] = total.blocked_by_type.get(resource_type, 0) + count
+        per_page["total"] = total.as_dict()
+        return per_page
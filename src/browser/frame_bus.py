@@ -0,0 +1,91 @@
+import asyncio
+import base64
+import time
+from dataclasses import dataclass, field
+from typing import Optional
+
+
+@dataclass
+class Frame:
+    seq: int
+    data: str  # base64 encoded image, kept exactly as produced by chrome
+    mime_type: str
+    source: str
+    timestamp: float = field(default_factory=time.monotonic)
+    _raw: Optional[bytes] = field(default=None, repr=False)
+    _data_url: Optional[str] = field(default=None, repr=False)
+
+    @property
+    def raw(self) -> bytes:
+        """Decoded image bytes, decoded once and shared by every consumer"""
+        if self._raw is None:
+            self._raw = base64.b64decode(self.data)
+        return self._raw
+
+    @property
+    def data_url(self) -> str:
+        if self._data_url is None:
+            self._data_url = f"data:{self.mime_type};base64,{self.data}"
+        return self._data_url
+
+
+class FrameBus:
+    """
+    Latest-frame channel of a browser context. The agent publishes the screenshots it
+    already took in `get_state`; live view captures are only accepted when no agent
+    frame younger than `fresh_for` seconds exists, so both never capture the same moment.
+    """
+
+    AGENT = "agent"
+
+    def __init__(self, fresh_for: float = 1.0):
+        self.fresh_for = fresh_for
+        self.latest_frame: Optional[Frame] = None
+        self.latest_agent_frame: Optional[Frame] = None
+        self.last_read_seq = 0
+        self._seq = 0
+        self._published = asyncio.Event()
+
+    def has_fresh_agent_frame(self) -> bool:
+        frame = self.latest_agent_frame
+        return frame is not None and time.monotonic() - frame.timestamp < self.fresh_for
+
+    def agent_frame_fresh_for(self) -> float:
+        """Seconds until the latest agent frame stops being fresh"""
+        if self.latest_agent_frame is None:
+            return 0.0
+        return max(self.fresh_for - (time.monotonic() - self.latest_agent_frame.timestamp), 0.0)
+
+    @property
+    def unread(self) -> bool:
+        return self.latest_frame is not None and self.latest_frame.seq > self.last_read_seq
+
+    def publish(self, data: str, mime_type: str = "image/jpeg", source: str = "screencast") -> Optional[Frame]:
+        """Publish a base64 frame, returns None when it was superseded by a fresh agent frame"""
+        if source != self.AGENT and self.has_fresh_agent_frame():
+            return None
+        self._seq += 1
+        frame = Frame(seq=self._seq, data=data, mime_type=mime_type, source=source)
+        self.latest_frame = frame
+        if source == self.AGENT:
+            self.latest_agent_frame = frame
+        self._published.set()
+        self._published = asyncio.Event()
+        return frame
+
+    def latest(self, max_age: Optional[float] = None) -> Optional[Frame]:
+        frame = self.latest_frame
+        if frame is None or (max_age is not None and time.monotonic() - frame.timestamp > max_age):
+            return None
+        return frame
+
+    async def wait_for_frame(self, after_seq: int = 0, timeout: float = 1.0) -> Optional[Frame]:
+        """Wait for a frame newer than `after_seq`, None if nothing was published within `timeout`"""
+        if self.latest_frame is None or self.latest_frame.seq <= after_seq:
+            try:
+                await asyncio.wait_for(self._published.wait(), timeout=timeout)
+            except asyncio.TimeoutError:
+                return None
+        frame = self.latest_frame
+        self.last_read_seq = max(self.last_read_seq, frame.seq)
+        return frame
@@ -0,0 +1,265 @@
+import asyncio
+import hashlib
+import json
+import logging
+import os
+import time
+from collections import OrderedDict
+from dataclasses import dataclass
+from email.utils import parsedate_to_datetime
+from typing import Optional
+
+from playwright.async_api import Route
+
+logger = logging.getLogger(__name__)
+
+# headers that describe the wire encoding of the original response, not the decoded body we store
+HOP_HEADERS = {"content-encoding", "content-length", "transfer-encoding", "connection", "keep-alive"}
+
+
+@dataclass
+class HttpCacheStats:
+    hits: int = 0
+    misses: int = 0
+    stores: int = 0
+    evictions: int = 0
+    bytes_saved: int = 0
+
+    @property
+    def hit_ratio(self) -> float:
+        lookups = self.hits + self.misses
+        return self.hits / lookups if lookups else 0.0
+
+    def as_dict(self) -> dict:
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_ratio": round(self.hit_ratio, 3),
+            "stores": self.stores,
+            "evictions": self.evictions,
+            "bytes_saved": self.bytes_saved,
+        }
+
+
+@dataclass
+class HttpCacheEntry:
+    url: str
+    status: int
+    headers: dict
+    size: int
+    stored_at: float
+    expires_at: float
+
+
+def freshness_lifetime(headers: dict, now: Optional[float] = None) -> Optional[float]:
+    """Seconds a response may be served from a shared cache, None if it must not be stored"""
+    now = now or time.time()
+    cache_control = {}
+    for directive in headers.get("cache-control", "").lower().split(","):
+        name, _, value = directive.strip().partition("=")
+        if name:
+            cache_control[name] = value.strip('"')
+
+    if {"no-store", "no-cache", "private"} & cache_control.keys():
+        return None
+    # the body may depend on request headers other than the encoding, e.g. cookies or language
+    vary = {name.strip().lower() for name in headers.get("vary", "").split(",") if name.strip()}
+    if vary - {"accept-encoding"}:
+        return None
+    # responses that set cookies belong to the context that received them
+    if "set-cookie" in headers:
+        return None
+    for directive in ("s-maxage", "max-age"):
+        if directive in cache_control:
+            try:
+                return max(float(cache_control[directive]), 0.0)
+            except ValueError:
+                return None
+    try:
+        date = parsedate_to_datetime(headers["date"]).timestamp() if "date" in headers else now
+        if "expires" in headers:
+            return max(parsedate_to_datetime(headers["expires"]).timestamp() - date, 0.0)
+        if "last-modified" in headers:
+            # heuristic freshness (RFC 9111 4.2.2): 10% of the time since last modification, at most a day
+            last_modified = parsedate_to_datetime(headers["last-modified"]).timestamp()
+            return min(max(date - last_modified, 0.0) * 0.1, 24 * 3600.0)
+    except (TypeError, ValueError):
+        return None
+    return None
+
+
+class SharedHttpCache:
+    """
+    Size-bounded on-disk response cache consulted by every CustomBrowserContext of a
+    CustomBrowser through request routing. Only GET responses of static resource types
+    that are fresh according to their cache headers are stored; eviction is LRU. Documents,
+    credentialed requests and responses setting cookies are never shared between contexts.
+    """
+
+    def __init__(
+            self,
+            cache_dir: str = "./tmp/http_cache",
+            max_size_bytes: int = 512 * 1024 * 1024,
+            max_entry_bytes: int = 10 * 1024 * 1024,
+            resource_types: tuple[str, ...] = ("script", "stylesheet", "image", "font"),
+    ):
+        self.cache_dir = cache_dir
+        self.max_size_bytes = max_size_bytes
+        self.max_entry_bytes = max_entry_bytes
+        self.resource_types = set(resource_types)
+        self.stats = HttpCacheStats()
+        self._entries: OrderedDict[str, HttpCacheEntry] = OrderedDict()
+        self._total_size = 0
+        os.makedirs(cache_dir, exist_ok=True)
+        self._load_index()
+
+    def _path(self, key: str, suffix: str) -> str:
+        return os.path.join(self.cache_dir, f"{key}.{suffix}")
+
+    @staticmethod
+    def _key(url: str) -> str:
+        return hashlib.sha256(url.split("#", 1)[0].encode("utf-8")).hexdigest()
+
+    def _load_index(self):
+        now = time.time()
+        metas = []
+        for name in os.listdir(self.cache_dir):
+            if not name.endswith(".json"):
+                continue
+            key = name[:-len(".json")]
+            try:
+                with open(self._path(key, "json"), "r", encoding="utf-8") as f:
+                    entry = HttpCacheEntry(**json.load(f))
+            except Exception:
+                self._remove_files(key)
+                continue
+            if entry.expires_at <= now or not os.path.exists(self._path(key, "bin")):
+                self._remove_files(key)
+                continue
+            metas.append((key, entry))
+        for key, entry in sorted(metas, key=lambda item: item[1].stored_at):
+            self._entries[key] = entry
+            self._total_size += entry.size
+        self._evict()
+
+    def _remove_files(self, key: str):
+        for suffix in ("json", "bin"):
+            try:
+                os.remove(self._path(key, suffix))
+            except FileNotFoundError:
+                pass
+
+    def _drop(self, key: str):
+        entry = self._entries.pop(key, None)
+        if entry is not None:
+            self._total_size -= entry.size
+        self._remove_files(key)
+
+    def _evict(self):
+        while self._total_size > self.max_size_bytes and self._entries:
+            key = next(iter(self._entries))
+            self._drop(key)
+            self.stats.evictions += 1
+
+    def _read(self, key: str) -> bytes:
+        with open(self._path(key, "bin"), "rb") as f:
+            return f.read()
+
+    def _write(self, key: str, entry: HttpCacheEntry, body: bytes):
+        with open(self._path(key, "bin"), "wb") as f:
+            f.write(body)
+        with open(self._path(key, "json"), "w", encoding="utf-8") as f:
+            json.dump(entry.__dict__, f)
+
+    async def get(self, url: str) -> Optional[tuple[HttpCacheEntry, bytes]]:
+        key = self._key(url)
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+        if entry.expires_at <= time.time():
+            self._drop(key)
+            return None
+        try:
+            body = await asyncio.to_thread(self._read, key)
+        except OSError:
+            self._drop(key)
+            return None
+        self._entries.move_to_end(key)
+        return entry, body
+
+    async def put(self, url: str, status: int, headers: dict, body: bytes) -> bool:
+        if status != 200 or len(body) > self.max_entry_bytes:
+            return False
+        lifetime = freshness_lifetime(headers)
+        if not lifetime:
+            return False
+        now = time.time()
+        key = self._key(url)
+        entry = HttpCacheEntry(
+            url=url,
+            status=status,
+            headers={k: v for k, v in headers.items() if k.lower() not in HOP_HEADERS},
+            size=len(body),
+            stored_at=now,
+            expires_at=now + lifetime,
+        )
+        try:
+            await asyncio.to_thread(self._write, key, entry, body)
+        except OSError as e:
+            logger.debug(f"Failed to store {url} in http cache: {e}")
+            return False
+        if key in self._entries:
+            self._total_size -= self._entries.pop(key).size
+        self._entries[key] = entry
+        self._total_size += entry.size
+        self.stats.stores += 1
+        self._evict()
+        return True
+
+    async def handle_route(self, route: Route):
+        """Playwright route handler serving cacheable requests from the shared cache"""
+        request = route.request
+        if request.method != "GET" or request.resource_type not in self.resource_types \
+                or not request.url.startswith("http") or "authorization" in request.headers:
+            await route.fallback()
+            return
+
+        cached = await self.get(request.url)
+        if cached is not None:
+            entry, body = cached
+            self.stats.hits += 1
+            self.stats.bytes_saved += entry.size
+            await route.fulfill(status=entry.status, headers=entry.headers, body=body)
+            return
+
+        self.stats.misses += 1
+        try:
+            # a followed redirect would be fulfilled under the original url and break relative links
+            response = await route.fetch(max_redirects=0)
+            if 300 <= response.status < 400:
+                await route.fallback()
+                return
+            body = await response.body()
+        except Exception as e:
+            logger.debug(f"Http cache fetch failed for {request.url}: {e}")
+            await route.fallback()
+            return
+        headers = {k: v for k, v in response.headers.items() if k.lower() not in HOP_HEADERS}
+        await route.fulfill(status=response.status, headers=headers, body=body)
+        await self.put(request.url, response.status, response.headers, body)
+
+    def reset_stats(self) -> HttpCacheStats:
+        """Return the counters of the current run and start a new one"""
+        stats, self.stats = self.stats, HttpCacheStats()
+        return stats
+
+
+# one cache per directory and process, two caches on the same directory would evict each other's files
+_shared_http_caches: dict[str, SharedHttpCache] = {}
+
+
+def get_shared_http_cache(cache_dir: str = "./tmp/http_cache") -> SharedHttpCache:
+    cache_dir = os.path.abspath(cache_dir)
+    if cache_dir not in _shared_http_caches:
+        _shared_http_caches[cache_dir] = SharedHttpCache(cache_dir)
+    return _shared_http_caches[cache_dir]
@@ -0,0 +1,165 @@
+import asyncio
+import logging
+import time
+from dataclasses import dataclass, field
+from typing import Optional
+
+from playwright.async_api import CDPSession, Page
+
+from .frame_bus import FrameBus
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass
+class ScreencastStats:
+    frames_received: int = 0
+    frames_emitted: int = 0
+    frames_dropped: int = 0
+    bytes_streamed: int = 0
+    started_at: float = field(default_factory=time.monotonic)
+
+    @property
+    def fps(self) -> float:
+        elapsed = time.monotonic() - self.started_at
+        return self.frames_emitted / elapsed if elapsed > 0 else 0.0
+
+    def as_dict(self) -> dict:
+        return {
+            "frames_received": self.frames_received,
+            "frames_emitted": self.frames_emitted,
+            "frames_dropped": self.frames_dropped,
+            "bytes_streamed": self.bytes_streamed,
+            "fps": round(self.fps, 2),
+        }
+
+
+class PageScreencast:
+    """
+    Live view of a page driven by CDP `Page.startScreencast`. Chrome only paints new
+    frames when the page changes, so an idle page streams nothing. Only the latest frame
+    is kept (older unread frames are dropped) and frame acks are delayed to the current
+    frame interval, which adapts between `min_fps` and `max_fps` to how fast the consumer
+    reads frames.
+
+    With a `frame_bus` the frames are published there instead of `next_frame`, and capture
+    is held back while the agent's own step screenshot is fresh.
+    """
+
+    def __init__(
+            self,
+            page: Page,
+            max_width: int = 1280,
+            max_height: int = 1100,
+            quality: int = 75,
+            max_fps: float = 10.0,
+            min_fps: float = 1.0,
+            frame_bus: Optional[FrameBus] = None,
+    ):
+        self.page = page
+        self.frame_bus = frame_bus
+        self.max_width = max_width
+        self.max_height = max_height
+        self.quality = quality
+        self.max_fps = max_fps
+        self.min_fps = min_fps
+        self.stats = ScreencastStats()
+        self._interval = 1.0 / max_fps
+        self._cdp: Optional[CDPSession] = None
+        self._frame: Optional[str] = None
+        self._frame_event = asyncio.Event()
+        self._last_ack = 0.0
+        self._last_read: Optional[float] = None
+        self._ack_tasks: set[asyncio.Task] = set()
+
+    async def start(self):
+        self._cdp = await self.page.context.new_cdp_session(self.page)
+        self._cdp.on("Page.screencastFrame", self._on_frame)
+        await self._cdp.send(
+            "Page.startScreencast",
+            {
+                "format": "jpeg",
+                "quality": self.quality,
+                "maxWidth": int(self.max_width),
+                "maxHeight": int(self.max_height),
+            },
+        )
+
+    async def stop(self):
+        for task in list(self._ack_tasks):
+            task.cancel()
+        if self._cdp is None:
+            return
+        try:
+            await self._cdp.send("Page.stopScreencast")
+            await self._cdp.detach()
+        except Exception as e:
+            logger.debug(f"Failed to stop screencast: {e}")
+        self._cdp = None
+
+    def _on_frame(self, params: dict):
+        self.stats.frames_received += 1
+        if self.frame_bus is not None:
+            self._publish(params["data"])
+        else:
+            if self._frame is not None:
+                # consumer did not read the previous frame, only the newest one matters
+                self.stats.frames_dropped += 1
+            # frames arrive base64 encoded already, keep them as-is for the data url
+            self._frame = params["data"]
+            self._frame_event.set()
+        task = asyncio.create_task(self._ack(params["sessionId"]))
+        self._ack_tasks.add(task)
+        task.add_done_callback(self._ack_tasks.discard)
+
+    def _publish(self, data: str):
+        consumer_bound = self.frame_bus.unread
+        if consumer_bound:
+            self.stats.frames_dropped += 1
+        self._adapt_interval(consumer_bound)
+        if self.frame_bus.publish(data, mime_type="image/jpeg") is None:
+            # the agent's step screenshot already shows this moment
+            self.stats.frames_dropped += 1
+            return
+        self.stats.frames_emitted += 1
+        self.stats.bytes_streamed += len(data)
+
+    async def _ack(self, session_id: int):
+        # chrome sends the next frame only after the ack: delaying it caps the capture rate
+        if self.frame_bus is not None:
+            await asyncio.sleep(self.frame_bus.agent_frame_fresh_for())
+        delay = self._last_ack + self._interval - time.monotonic()
+        if delay > 0:
+            await asyncio.sleep(delay)
+        self._last_ack = time.monotonic()
+        if self._cdp is not None:
+            try:
+                await self._cdp.send("Page.screencastFrameAck", {"sessionId": session_id})
+            except Exception as e:
+                logger.debug(f"Failed to ack screencast frame: {e}")
+
+    def _adapt_interval(self, consumer_bound: bool):
+        now = time.monotonic()
+        if consumer_bound and self._last_read is not None:
+            # a frame was already waiting: slow capture down to the consumer's pace
+            target = min(max(now - self._last_read, 1.0 / self.max_fps), 1.0 / self.min_fps)
+        else:
+            target = 1.0 / self.max_fps
+        self._interval = 0.8 * self._interval + 0.2 * target
+        self._last_read = now
+
+    async def next_frame(self, timeout: float = 1.0) -> Optional[str]:
+        """Wait for a new base64 jpeg frame, None if the page stayed idle for `timeout` seconds"""
+        consumer_bound = self._frame_event.is_set()
+        try:
+            await asyncio.wait_for(self._frame_event.wait(), timeout=timeout)
+        except asyncio.TimeoutError:
+            return None
+        self._frame_event.clear()
+        frame, self._frame = self._frame, None
+        if frame is None:
+            return None
+        self._adapt_interval(consumer_bound)
+        self.stats.frames_emitted += 1
+        self.stats.bytes_streamed += len(frame)
+        return frame
@@ -0,0 +1,111 @@
+import json
+import logging
+import os
+import re
+import time
+from typing import Optional
+from urllib.parse import urlparse
+
+logger = logging.getLogger(__name__)
+
+
+def site_of(host: str) -> str:
+    """Approximate registrable domain of a host: `accounts.google.com` -> `google.com`"""
+    host = host.lstrip(".").lower()
+    labels = host.split(".")
+    if len(labels) <= 2 or re.fullmatch(r"[\d.]+", host):
+        return host
+    # keep three labels for common second-level public suffixes (co.uk, com.au, ...)
+    if len(labels[-2]) <= 3 and len(labels[-1]) == 2:
+        return ".".join(labels[-3:])
+    return ".".join(labels[-2:])
+
+
+class StorageStateCache:
+    """
+    Cookies and localStorage snapshots keyed by site and account, stored as
+    `<cache_dir>/<account>/<site>.json`. Snapshots older than `max_age` seconds or
+    whose cookies have all expired are considered stale and deleted on load.
+    """
+
+    def __init__(self, cache_dir: str = "./tmp/storage_states", max_age: float = 7 * 24 * 3600):
+        self.cache_dir = cache_dir
+        self.max_age = max_age
+
+    @staticmethod
+    def _safe_name(name: str) -> str:
+        return re.sub(r"[^\w.-]", "_", name)
+
+    def _account_dir(self, account: str) -> str:
+        return os.path.join(self.cache_dir, self._safe_name(account))
+
+    def _path(self, site: str, account: str) -> str:
+        return os.path.join(self._account_dir(account), f"{self._safe_name(site)}.json")
+
+    def is_stale(self, snapshot: dict, now: Optional[float] = None) -> bool:
+        now = now or time.time()
+        if now - snapshot.get("saved_at", 0) > self.max_age:
+            return True
+        cookies = snapshot.get("cookies", [])
+        if cookies and all(0 < cookie.get("expires", -1) < now for cookie in cookies):
+            return True
+        return not cookies and not snapshot.get("origins")
+
+    def invalidate(self, site: str, account: str = "default"):
+        try:
+            os.remove(self._path(site, account))
+            logger.info(f"Invalidated storage state of {site} ({account})")
+        except FileNotFoundError:
+            pass
+
+    def load(self, site: str, account: str = "default") -> Optional[dict]:
+        path = self._path(site, account)
+        if not os.path.exists(path):
+            return None
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                snapshot = json.load(f)
+        except (OSError, ValueError):
+            self.invalidate(site, account)
+            return None
+        if self.is_stale(snapshot):
+            self.invalidate(site, account)
+            return None
+        now = time.time()
+        snapshot["cookies"] = [c for c in snapshot.get("cookies", []) if not 0 < c.get("expires", -1) < now]
+        return snapshot
+
+    def load_all(self, account: str = "default") -> dict:
+        """Merge every fresh snapshot of an account into one playwright storage state"""
+        state = {"cookies": [], "origins": []}
+        account_dir = self._account_dir(account)
+        if not os.path.isdir(account_dir):
+            return state
+        for name in sorted(os.listdir(account_dir)):
+            if not name.endswith(".json"):
+                continue
+            snapshot = self.load(name[:-len(".json")], account)
+            if snapshot:
+                state["cookies"].extend(snapshot["cookies"])
+                state["origins"].extend(snapshot.get("origins", []))
+        return state
+
+    def save(self, storage_state: dict, account: str = "default") -> list[str]:
+        """Split a playwright storage state by site and store one snapshot per site"""
+        snapshots: dict[str, dict] = {}
+        now = time.time()
+        for cookie in storage_state.get("cookies", []):
+            site = site_of(cookie.get("domain", ""))
+            snapshots.setdefault(site, {"saved_at": now, "cookies": [], "origins": []})["cookies"].append(cookie)
+        for origin in storage_state.get("origins", []):
+            if not origin.get("localStorage"):
+                continue
+            site = site_of(urlparse(origin["origin"]).hostname or "")
+            snapshots.setdefault(site, {"saved_at": now, "cookies": [], "origins": []})["origins"].append(origin)
+
+        os.makedirs(self._account_dir(account), exist_ok=True)
+        for site, snapshot in snapshots.items():
+            with open(self._path(site, account), "w", encoding="utf-8") as f:
+                json.dump(snapshot, f)
+        logger.info(f"Saved storage state of {len(snapshots)} sites ({account})")
+        return list(snapshots)
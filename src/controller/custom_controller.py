@@ -1,7 +1,9 @@
+import asyncio
 import pdb
+import weakref
 
-import pyperclip
 from typing import Optional, Type
+from playwright.async_api import Page
 from pydantic import BaseModel
 from browser_use.agent.views import ActionResult
 from browser_use.browser.context import BrowserContext
@@ -21,30 +23,208 @@ from browser_use.controller.views import (
 )
 import logging
 
+from src.browser.custom_context import CustomBrowserContext
+from src.controller.custom_views import ExtractUrlsContentAction, FillFormAction
+from src.utils.cpu_pool import get_cpu_pool
+from src.utils.extraction_cache import ExtractionCache, get_shared_extraction_cache
+from src.utils.url_registry import VisitedUrlRegistry
+
 logger = logging.getLogger(__name__)
 
+# messages of the actions returning page content, CustomAgent keeps them for its final result
+PAGE_CONTENT_MARKERS = ("Extracted page", "Extracted content of", "already read by another agent")
+
+
+# sets every field in one round trip, returns per field the value it now holds or the failure reason
+_FILL_FORM_JS = """
+(fields) => fields.map(({selector, value}) => {
+    try {
+        // an invalid selector throws, it must only fail its own field
+        const el = document.querySelector(selector);
+        if (!el) return {error: "element not found"};
+        if (el.disabled || el.readOnly) return {error: "element is disabled or read-only"};
+        const tag = el.tagName.toLowerCase();
+        const type = (el.type || "").toLowerCase();
+        el.focus();
+        if (type === "checkbox" || type === "radio") {
+            const checked = !["false", "0", "no", "off", "unchecked", ""].includes(value.trim().toLowerCase());
+            // a click fires the same events as the user toggling it
+            if (el.checked !== checked) el.click();
+            return {value: String(el.checked)};
+        }
+        if (tag === "select") {
+            const option = Array.from(el.options).find(o => o.value === value || o.text.trim() === value.trim());
+            if (!option) return {error: `no option "${value}"`};
+            el.value = option.value;
+        } else if (tag === "input" || tag === "textarea") {
+            // the native setter keeps framework controlled inputs (react, vue) in sync
+            const proto = tag === "textarea" ? HTMLTextAreaElement.prototype : HTMLInputElement.prototype;
+            Object.getOwnPropertyDescriptor(proto, "value").set.call(el, value);
+        } else if (el.isContentEditable) {
+            el.textContent = value;
+        } else {
+            return {error: `<${tag}> is not a form field`};
+        }
+        el.dispatchEvent(new Event("input", {bubbles: true}));
+        el.dispatchEvent(new Event("change", {bubbles: true}));
+        el.blur();
+        return {value: el.isContentEditable ? el.textContent : el.value};
+    } catch (e) {
+        return {error: String(e)};
+    }
+})
+"""
+
+# waits until the DOM stops changing, then reads the fields back to catch values the page reset
+_SETTLE_FORM_JS = """
+([selectors, quietMs, timeoutMs]) => new Promise(resolve => {
+    let quietTimer = null;
+    let capTimer = null;
+    const observer = new MutationObserver(() => {
+        clearTimeout(quietTimer);
+        quietTimer = setTimeout(() => done(true), quietMs);
+    });
+    const done = (stable) => {
+        observer.disconnect();
+        clearTimeout(quietTimer);
+        clearTimeout(capTimer);
+        resolve({
+            stable,
+            values: selectors.map(selector => {
+                const el = document.querySelector(selector);
+                if (!el) return null;
+                const type = (el.type || "").toLowerCase();
+                if (type === "checkbox" || type === "radio") return String(el.checked);
+                return el.isContentEditable ? el.textContent : el.value;
+            }),
+        });
+    };
+    observer.observe(document.body, {subtree: true, childList: true, attributes: true, characterData: true});
+    quietTimer = setTimeout(() => done(true), quietMs);
+    capTimer = setTimeout(() => done(false), timeoutMs);
+})
+"""
+
+
+def _extract_main_content(html: str, output_format: str) -> str:
+    return MainContentExtractor.extract(html=html, output_format=output_format)  # type: ignore
+
 
 class CustomController(Controller):
     def __init__(self, exclude_actions: list[str] = [],
-                 output_model: Optional[Type[BaseModel]] = None
+                 output_model: Optional[Type[BaseModel]] = None,
+                 extraction_cache: Optional[ExtractionCache] = None,
+                 use_system_clipboard: bool = False,
+                 max_parallel_tabs: int = 4,
+                 max_urls_per_action: int = 8,
+                 max_chars_per_url: int = 4000,
+                 url_registry: Optional[VisitedUrlRegistry] = None,
                  ):
         super().__init__(exclude_actions=exclude_actions, output_model=output_model)
+        # extracted page contents, shared by all agents of the process by default
+        self.extraction_cache = extraction_cache or get_shared_extraction_cache()
+        # the OS clipboard is global to every agent and costs an xclip/xsel process per call on linux,
+        # so each agent gets its own in-memory clipboard and the OS one is only mirrored on request
+        self.use_system_clipboard = use_system_clipboard
+        self._clipboards: weakref.WeakKeyDictionary[BrowserContext, str] = weakref.WeakKeyDictionary()
+        # limits of extract_urls_content
+        self.max_parallel_tabs = max_parallel_tabs
+        self.max_urls_per_action = max_urls_per_action
+        self.max_chars_per_url = max_chars_per_url
+        # pages read by the other agents sharing this controller, e.g. the sub-agents of a deep research
+        self.url_registry = url_registry
         self._register_custom_actions()
+        if url_registry is not None:
+            self._register_visited_url_actions()
+
+    @staticmethod
+    def _visitor_id(browser: BrowserContext) -> str:
+        # pooled contexts serve several agents in turn, each with its own visitor id
+        return getattr(browser, "visitor_id", browser.context_id)
+
+    def _mark_visited(self, url: str, browser: BrowserContext):
+        if self.url_registry is not None:
+            self.url_registry.mark_visited(url, self._visitor_id(browser))
+
+    def _cached_visit(self, url: str, browser: BrowserContext) -> Optional[ActionResult]:
+        """The extraction another agent already made of `url`, offered once instead of loading it again"""
+        cached = self.extraction_cache.get_latest(url)
+        if cached is None or not self.url_registry.offer_cached(url, self._visitor_id(browser)):
+            return None
+        if len(cached) > self.max_chars_per_url:
+            cached = cached[:self.max_chars_per_url] + "\n... (truncated)"
+        msg = (f'♻️  {url} was already read by another agent, reusing its extracted content instead of '
+               f'opening it. Open it again only if you need to interact with the page\n: {cached}\n')
+        logger.info(f'♻️  Reused the extraction of {url}')
+        return ActionResult(extracted_content=msg, include_in_memory=True)
+
+    async def _extract_page_content(self, page: Page, output_format: str) -> str:
+        if await page.evaluate("document.contentType") == "application/pdf":
+            # the pdf viewer has no DOM text, read it through jina without navigating the page
+            content_hash = self.extraction_cache.content_hash(f"pdf:{page.url}")
+            content = self.extraction_cache.get(page.url, content_hash, output_format)
+            if content is None:
+                response = await page.context.request.get(f"https://r.jina.ai/{page.url}")
+                content = await response.text()
+                self.extraction_cache.put(page.url, content_hash, output_format, content)
+            return content
+        # extract from the already loaded DOM, the page is neither navigated nor reloaded
+        html = await page.content()
+        # hashlib releases the GIL on large buffers, main content extraction does not
+        content_hash = await get_cpu_pool().run_in_thread(self.extraction_cache.content_hash, html)
+        content = self.extraction_cache.get(page.url, content_hash, output_format)
+        if content is None:
+            content = await get_cpu_pool().run_in_process(_extract_main_content, html, output_format)
+            # keep the reader layout deep research's recorder parses title and url from
+            content = f"Title: {await page.title()}\nURL Source: {page.url}\nMarkdown Content:\n{content}"
+            self.extraction_cache.put(page.url, content_hash, output_format, content)
+        return content
+
+    async def _open_and_extract(self, browser: BrowserContext, url: str, output_format: str) -> str:
+        if isinstance(browser, CustomBrowserContext):
+            page = await browser.new_background_page()
+        else:
+            page = await (await browser.get_session()).context.new_page()
+        try:
+            await page.goto(url, wait_until="domcontentloaded", timeout=20000)
+            self._mark_visited(page.url, browser)
+            return await self._extract_page_content(page, output_format)
+        finally:
+            await page.close()
+
+    def _get_clipboard(self, browser: BrowserContext) -> Optional[str]:
+        if isinstance(browser, CustomBrowserContext):
+            return browser.clipboard
+        return self._clipboards.get(browser)
+
+    def _set_clipboard(self, browser: BrowserContext, text: str):
+        if isinstance(browser, CustomBrowserContext):
+            browser.clipboard = text
+        else:
+            self._clipboards[browser] = text
 
     def _register_custom_actions(self):
         """Register all custom browser actions"""
 
-        @self.registry.action("Copy text to clipboard")
-        def copy_to_clipboard(text: str):
-            pyperclip.copy(text)
+        @self.registry.action("Copy text to clipboard", requires_browser=True)
+        async def copy_to_clipboard(text: str, browser: BrowserContext):
+            self._set_clipboard(browser, text)
+            if self.use_system_clipboard:
+                import pyperclip
+                await get_cpu_pool().run_in_thread(pyperclip.copy, text)
             return ActionResult(extracted_content=text)
 
         @self.registry.action("Paste text from clipboard", requires_browser=True)
         async def paste_from_clipboard(browser: BrowserContext):
-            text = pyperclip.paste()
-            # send text to browser
+            text = self._get_clipboard(browser)
+            if text is None and self.use_system_clipboard:
+                import pyperclip
+                text = await get_cpu_pool().run_in_thread(pyperclip.paste)
+            if not text:
+                return ActionResult(error="Clipboard is empty, copy some text first")
+            # insert into the focused element in one input event, as a real paste does
             page = await browser.get_current_page()
-            await page.keyboard.type(text)
+            await page.keyboard.insert_text(text)
 
             return ActionResult(extracted_content=text)
 
@@ -55,17 +235,138 @@ class CustomController(Controller):
         )
         async def extract_content(params: ExtractPageContentAction, browser: BrowserContext):
             page = await browser.get_current_page()
-            # use jina reader
-            url = page.url
-            jina_url = f"https://r.jina.ai/{url}"
-            await page.goto(jina_url)
             output_format = 'markdown' if params.include_links else 'text'
-            content = MainContentExtractor.extract(  # type: ignore
-                html=await page.content(),
-                output_format=output_format,
-            )
-            # go back to org url
-            await page.go_back()
+            content = await self._extract_page_content(page, output_format)
+            self._mark_visited(page.url, browser)
             msg = f'📄  Extracted page content as {output_format}\n: {content}\n'
             logger.info(msg)
             return ActionResult(extracted_content=msg)
+
+        @self.registry.action(
+            'Fill several form fields in one step. fields is a list of {"index": element index, "value": text}; '
+            'for a select use the option text, for a checkbox or radio use "true" or "false". '
+            'Click the submit button with a separate action afterwards',
+            param_model=FillFormAction,
+            requires_browser=True,
+        )
+        async def fill_form(params: FillFormAction, browser: BrowserContext):
+            page = await browser.get_current_page()
+            selector_map = await browser.get_selector_map()
+            # element index -> reason
+            failed: dict[int, str] = {}
+            targets = []
+            for field in params.fields:
+                element_node = selector_map.get(field.index)
+                if element_node is None:
+                    failed[field.index] = "element index does not exist"
+                    continue
+                parent = element_node.parent
+                while parent is not None and parent.tag_name != "iframe":
+                    parent = parent.parent
+                if parent is not None:
+                    failed[field.index] = "element is inside an iframe, use input_text"
+                    continue
+                targets.append((field, browser._enhanced_css_selector_for_element(element_node)))
+
+            try:
+                results = await page.evaluate(
+                    _FILL_FORM_JS, [{"selector": selector, "value": field.value} for field, selector in targets]
+                )
+            except Exception as e:
+                # e.g. a change handler submitted the form, which fields were set before is unknown
+                results = [{"error": f"the page navigated while the form was filled ({e})"}] * len(targets)
+            filled = []
+            for (field, selector), result in zip(targets, results):
+                if "error" in result:
+                    failed[field.index] = result["error"]
+                else:
+                    filled.append((field, selector, result["value"]))
+
+            # a single stability check once every field is set, not one between each field
+            notes = []
+            if filled:
+                try:
+                    settled = await page.evaluate(
+                        _SETTLE_FORM_JS, [[selector for _, selector, _ in filled], 300, 3000]
+                    )
+                    if not settled["stable"]:
+                        notes.append("the page kept changing after the form was filled")
+                    for (field, _, value), current in zip(filled, settled["values"]):
+                        if current != value:
+                            failed[field.index] = f"the page changed the value to {current!r}"
+                except Exception as e:
+                    notes.append(f"the page navigated or reloaded after the form was filled ({e})")
+                await page.wait_for_load_state()
+
+            ok = [str(field.index) for field, _, _ in filled if field.index not in failed]
+            msg = f'📝  Filled {len(ok)}/{len(params.fields)} form fields: {", ".join(ok) or "none"}'
+            if notes:
+                msg += "\n" + "\n".join(notes)
+            logger.info(msg)
+            if failed:
+                error = "Failed form fields:\n" + "\n".join(f"{index}: {reason}" for index, reason in failed.items())
+                logger.info(error)
+                return ActionResult(extracted_content=msg, error=error, include_in_memory=True)
+            return ActionResult(extracted_content=msg, include_in_memory=True)
+
+        @self.registry.action(
+            'Extract the main content of several urls at once (e.g. the relevant search results) in one step, '
+            'instead of opening and extracting them one by one. The current page stays as it is',
+            param_model=ExtractUrlsContentAction,
+            requires_browser=True,
+        )
+        async def extract_urls_content(params: ExtractUrlsContentAction, browser: BrowserContext):
+            output_format = 'markdown' if params.include_links else 'text'
+            urls = list(dict.fromkeys(params.urls))[:self.max_urls_per_action]
+            semaphore = asyncio.Semaphore(self.max_parallel_tabs)
+
+            async def fetch(url: str) -> str:
+                # pages another agent of the run already extracted are not opened again, without a
+                # registry (a single agent) the page may have changed since and is read again
+                if self.url_registry is not None:
+                    cached = self.extraction_cache.get_latest(url, output_format)
+                    if cached is not None:
+                        self._mark_visited(url, browser)
+                        return cached
+                async with semaphore:
+                    return await self._open_and_extract(browser, url, output_format)
+
+            results = await asyncio.gather(*[fetch(url) for url in urls], return_exceptions=True)
+            sections = []
+            for i, (url, content) in enumerate(zip(urls, results), start=1):
+                if isinstance(content, BaseException):
+                    sections.append(f"[{i}] {url}\nFailed to extract: {content}")
+                    continue
+                if len(content) > self.max_chars_per_url:
+                    content = content[:self.max_chars_per_url] + "\n... (truncated)"
+                sections.append(f"[{i}] {url}\n{content}")
+            msg = f'📄  Extracted content of {len(urls)} urls as {output_format}\n: ' + "\n\n".join(sections) + "\n"
+            logger.info(msg)
+            return ActionResult(extracted_content=msg, include_in_memory=True)
+
+    def _register_visited_url_actions(self):
+        """Navigation actions that reuse pages other agents already read"""
+
+        @self.registry.action('Navigate to URL in the current tab', param_model=GoToUrlAction, requires_browser=True)
+        async def go_to_url(params: GoToUrlAction, browser: BrowserContext):
+            cached = self._cached_visit(params.url, browser)
+            if cached is not None:
+                return cached
+            page = await browser.get_current_page()
+            await page.goto(params.url)
+            await page.wait_for_load_state()
+            self._mark_visited(page.url, browser)
+            msg = f'🔗  Navigated to {params.url}'
+            logger.info(msg)
+            return ActionResult(extracted_content=msg, include_in_memory=True)
+
+        @self.registry.action('Open url in new tab', param_model=OpenTabAction, requires_browser=True)
+        async def open_tab(params: OpenTabAction, browser: BrowserContext):
+            cached = self._cached_visit(params.url, browser)
+            if cached is not None:
+                return cached
+            await browser.create_new_tab(params.url)
+            self._mark_visited(params.url, browser)
+            msg = f'🔗  Opened new tab with {params.url}'
+            logger.info(msg)
+            return ActionResult(extracted_content=msg, include_in_memory=True)
@@ -0,0 +1,15 @@
+from pydantic import BaseModel
+
+
+class ExtractUrlsContentAction(BaseModel):
+    urls: list[str]
+    include_links: bool = False
+
+
+class FormField(BaseModel):
+    index: int
+    value: str
+
+
+class FillFormAction(BaseModel):
+    fields: list[FormField]
@@ -0,0 +1,115 @@
+import json
+import math
+import os
+import re
+from collections import Counter
+from dataclasses import asdict, dataclass, field
+from typing import Optional
+
+TOKEN_PATTERN = re.compile(r"\w+", re.UNICODE)
+STOPWORDS = {
+    "the", "and", "for", "with", "that", "this", "from", "are", "was", "were", "has", "have", "had",
+    "not", "but", "its", "into", "about", "than", "then", "their", "there", "which", "what", "when",
+    "will", "would", "can", "could", "also", "more", "most", "other", "such", "been", "being", "how",
+}
+
+
+def tokenize(text: str) -> list[str]:
+    return [token for token in TOKEN_PATTERN.findall(text.lower()) if len(token) > 2 and token not in STOPWORDS]
+
+
+@dataclass
+class Chunk:
+    chunk_id: int
+    text: str
+    source: str = ""
+    metadata: dict = field(default_factory=dict)
+
+
+def split_chunks(text: str, chunk_words: int = 200, overlap_words: int = 40) -> list[str]:
+    """Split text in windows of `chunk_words` words overlapping by `overlap_words`"""
+    words = text.split()
+    if len(words) <= chunk_words:
+        return [text.strip()] if words else []
+    step = max(chunk_words - overlap_words, 1)
+    return [" ".join(words[start:start + chunk_words]) for start in range(0, len(words) - overlap_words, step)]
+
+
+class BM25Index:
+    """In-process inverted index with Okapi BM25 ranking over chunks of the added texts"""
+
+    def __init__(self, k1: float = 1.5, b: float = 0.75, chunk_words: int = 200, overlap_words: int = 40):
+        self.k1 = k1
+        self.b = b
+        self.chunk_words = chunk_words
+        self.overlap_words = overlap_words
+        self.chunks: list[Chunk] = []
+        # term -> {chunk id: term frequency}
+        self.postings: dict[str, dict[int, int]] = {}
+        self.lengths: list[int] = []
+        self.total_length = 0
+
+    def __len__(self) -> int:
+        return len(self.chunks)
+
+    def add(self, text: str, source: str = "", **metadata) -> list[Chunk]:
+        added = []
+        for chunk_text in split_chunks(text, self.chunk_words, self.overlap_words):
+            chunk = Chunk(chunk_id=len(self.chunks), text=chunk_text, source=source, metadata=metadata)
+            self._index(chunk)
+            added.append(chunk)
+        return added
+
+    def _index(self, chunk: Chunk):
+        terms = tokenize(chunk.text)
+        self.chunks.append(chunk)
+        self.lengths.append(len(terms))
+        self.total_length += len(terms)
+        for term, count in Counter(terms).items():
+            self.postings.setdefault(term, {})[chunk.chunk_id] = count
+
+    def search(self, query: str, k: Optional[int] = 5, max_query_terms: int = 64) -> list[tuple[float, Chunk]]:
+        """Best chunks for `query`, all matching chunks when `k` is None"""
+        if not self.chunks:
+            return []
+        # long queries (e.g. a whole search result) keep their most frequent terms
+        query_terms = [term for term, _ in Counter(tokenize(query)).most_common(max_query_terms)]
+        n = len(self.chunks)
+        avg_length = self.total_length / n or 1
+        scores: dict[int, float] = {}
+        for term in query_terms:
+            postings = self.postings.get(term)
+            if not postings:
+                continue
+            idf = math.log(1 + (n - len(postings) + 0.5) / (len(postings) + 0.5))
+            for chunk_id, tf in postings.items():
+                norm = tf + self.k1 * (1 - self.b + self.b * self.lengths[chunk_id] / avg_length)
+                scores[chunk_id] = scores.get(chunk_id, 0.0) + idf * tf * (self.k1 + 1) / norm
+        ranked = sorted(scores.items(), key=lambda item: (-item[1], item[0]))
+        if k is not None:
+            ranked = ranked[:k]
+        return [(score, self.chunks[chunk_id]) for chunk_id, score in ranked]
+
+    def save(self, path: str):
+        tmp_path = f"{path}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump({
+                "k1": self.k1,
+                "b": self.b,
+                "chunk_words": self.chunk_words,
+                "overlap_words": self.overlap_words,
+                "chunks": [asdict(chunk) for chunk in self.chunks],
+            }, f)
+        os.replace(tmp_path, path)
+
+    @classmethod
+    def load(cls, path: str) -> Optional["BM25Index"]:
+        if not os.path.exists(path):
+            return None
+        with open(path, "r", encoding="utf-8") as f:
+            data = json.load(f)
+        index = cls(k1=data["k1"], b=data["b"], chunk_words=data["chunk_words"], overlap_words=data["overlap_words"])
+        # postings are rebuilt rather than stored, they are several times larger than the text
+        for chunk in data["chunks"]:
+            index._index(Chunk(**chunk))
+        return index
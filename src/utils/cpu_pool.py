@@ -0,0 +1,143 @@
+import asyncio
+import logging
+import multiprocessing
+import os
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from dataclasses import dataclass, field
+from functools import partial
+from typing import Any, Callable, Optional
+
+logger = logging.getLogger(__name__)
+
+
+class CpuWorkPool:
+    """
+    Sized executors for CPU bound work that must not run on the event loop serving
+    Gradio and the agents. Pure python work (parsing, json repair) goes to processes,
+    work that releases the GIL (PIL, hashing, base64 of large buffers) goes to threads.
+    """
+
+    def __init__(self, max_processes: Optional[int] = None, max_threads: Optional[int] = None):
+        cpu_count = os.cpu_count() or 1
+        self.max_processes = max_processes or min(4, cpu_count)
+        self.max_threads = max_threads or min(8, cpu_count + 4)
+        self._process_pool: Optional[ProcessPoolExecutor] = None
+        self._thread_pool: Optional[ThreadPoolExecutor] = None
+
+    @property
+    def process_pool(self) -> ProcessPoolExecutor:
+        if self._process_pool is None:
+            # the pool starts after gradio and playwright threads, a forked worker could inherit
+            # their held locks and the playwright driver pipes, forkserver workers start clean
+            self._process_pool = ProcessPoolExecutor(
+                max_workers=self.max_processes, mp_context=multiprocessing.get_context("forkserver")
+            )
+        return self._process_pool
+
+    @property
+    def thread_pool(self) -> ThreadPoolExecutor:
+        if self._thread_pool is None:
+            self._thread_pool = ThreadPoolExecutor(max_workers=self.max_threads, thread_name_prefix="cpu-work")
+        return self._thread_pool
+
+    async def run_in_process(self, fn: Callable, *args: Any, **kwargs: Any) -> Any:
+        """Run a picklable module level function in a worker process"""
+        pool = self.process_pool
+        try:
+            return await asyncio.get_running_loop().run_in_executor(pool, partial(fn, *args, **kwargs))
+        except BrokenProcessPool:
+            # a worker died (e.g. killed out of memory), the next calls get a new pool
+            if self._process_pool is pool:
+                logger.warning("CPU work process pool is broken, starting a new one")
+                pool.shutdown(wait=False, cancel_futures=True)
+                self._process_pool = None
+            raise
+
+    async def run_in_thread(self, fn: Callable, *args: Any, **kwargs: Any) -> Any:
+        return await asyncio.get_running_loop().run_in_executor(self.thread_pool, partial(fn, *args, **kwargs))
+
+    def shutdown(self):
+        if self._process_pool is not None:
+            self._process_pool.shutdown(wait=False, cancel_futures=True)
+            self._process_pool = None
+        if self._thread_pool is not None:
+            self._thread_pool.shutdown(wait=False, cancel_futures=True)
+            self._thread_pool = None
+
+
+_cpu_pool: Optional[CpuWorkPool] = None
+
+
+def get_cpu_pool() -> CpuWorkPool:
+    """Process wide pool shared by the controller, agents, deep research and the web UI"""
+    global _cpu_pool
+    if _cpu_pool is None:
+        _cpu_pool = CpuWorkPool(
+            max_processes=int(os.getenv("CPU_POOL_PROCESSES", "0")) or None,
+            max_threads=int(os.getenv("CPU_POOL_THREADS", "0")) or None,
+        )
+    return _cpu_pool
+
+
+@dataclass
+class LoopLagStats:
+    samples: int = 0
+    total_lag_ms: float = 0.0
+    max_lag_ms: float = 0.0
+    lags_ms: list[float] = field(default_factory=list, repr=False)
+
+    @property
+    def avg_lag_ms(self) -> float:
+        return self.total_lag_ms / self.samples if self.samples else 0.0
+
+    @property
+    def p95_lag_ms(self) -> float:
+        if not self.lags_ms:
+            return 0.0
+        ordered = sorted(self.lags_ms)
+        return ordered[min(int(len(ordered) * 0.95), len(ordered) - 1)]
+
+    def as_dict(self) -> dict:
+        return {
+            "samples": self.samples,
+            "avg_lag_ms": round(self.avg_lag_ms, 2),
+            "p95_lag_ms": round(self.p95_lag_ms, 2),
+            "max_lag_ms": round(self.max_lag_ms, 2),
+        }
+
+
+class LoopLagMonitor:
+    """Measures how late the event loop wakes up a sleeping task, i.e. how long it was blocked"""
+
+    def __init__(self, interval: float = 0.05, max_samples: int = 10000):
+        self.interval = interval
+        self.max_samples = max_samples
+        self.stats = LoopLagStats()
+        self._task: Optional[asyncio.Task] = None
+
+    def start(self):
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    async def _run(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            start = loop.time()
+            await asyncio.sleep(self.interval)
+            lag_ms = max(loop.time() - start - self.interval, 0.0) * 1000
+            self.stats.samples += 1
+            self.stats.total_lag_ms += lag_ms
+            self.stats.max_lag_ms = max(self.stats.max_lag_ms, lag_ms)
+            if len(self.stats.lags_ms) < self.max_samples:
+                self.stats.lags_ms.append(lag_ms)
+
+    async def stop(self) -> LoopLagStats:
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        return self.stats
@@ -5,20 +5,35 @@ from dotenv import load_dotenv
 
 load_dotenv()
 import asyncio
+import math
 import os
 import sys
 import logging
+import time
 from pprint import pprint
 from uuid import uuid4
 from src.utils import utils
 from src.agent.custom_agent import CustomAgent
 import json
 from browser_use.agent.service import Agent
-from browser_use.browser.browser import BrowserConfig, Browser
-from langchain.schema import SystemMessage, HumanMessage
-from json_repair import repair_json
+from browser_use.browser.browser import BrowserConfig
+from src.browser.custom_browser import CustomBrowser
+from src.browser.context_pool import CustomBrowserContextPool
+from src.browser.custom_context import CustomBrowserContextConfig
+from langchain.schema import SystemMessage, HumanMessage, AIMessage
 from src.agent.custom_prompts import CustomSystemPrompt, CustomAgentMessagePrompt
 from src.controller.custom_controller import CustomController
+from src.utils.extraction_cache import ExtractionCache
+from src.utils.cpu_pool import LoopLagMonitor
+from src.utils.query_dedup import QueryDeduplicator
+from src.utils.query_scheduler import QueryScheduler
+from src.utils.bm25_index import BM25Index
+from src.utils.report_writer import MapReduceReportWriter
+from src.utils.research_checkpoint import ResearchCheckpoint
+from src.utils.research_store import (ResearchRecordStore, estimate_tokens,
+                                       relevant_excerpts)
+from src.utils.step_budget import StepBudgetController
+from src.utils.url_registry import VisitedUrlRegistry
 
 logger = logging.getLogger(__name__)
 
@@ -67,6 +82,7 @@ async def deep_research(task, llm, **kwargs):
     1.  **User Instruction:** The original instruction given by the user.
     2.  **Previous Queries:** History Queries.
     3.  **Previous Search Results:** Textual data gathered from prior search queries. If there are no previous search results this string will be empty.
+    4.  **Related Searched Content:** Excerpts of the pages read so far that relate to the user instruction. If nothing was searched yet this string will be empty.
     """
     search_messages = [SystemMessage(content=search_system_prompt)]
 
@@ -110,91 +126,307 @@ Provide your output as a JSON formatted list. Each item in the list must adhere
 1. **User Instruction:** The original instruction given by the user. This helps you determine what kind of information will be useful and how to structure your thinking.
 2. **Previous Recorded Information:** Textual data gathered and recorded from previous searches and processing, represented as a single text string.
 3. **Current Search Results:** Textual data gathered from the most recent search query.
+4. **Related Searched Content:** Excerpts of pages read for other queries that relate to the current search results. Use them as context only, record information from the Current Search Results.
     """
     record_messages = [SystemMessage(content=record_system_prompt)]
 
-    browser = Browser(
+    browser = CustomBrowser(
         config=BrowserConfig(
             disable_security=True,
             headless=kwargs.get("headless", False),  # Set to False to see browser actions
-        )
+        ),
+        # opt-in, routing every request disables Chromium's own cache for the context
+        http_cache=kwargs.get("http_cache", None),
     )
-    controller = CustomController()
-
     search_iteration = 0
     max_search_iterations = kwargs.get("max_search_iterations", 10)  # Limit search iterations to prevent infinite loop
     use_vision = kwargs.get("use_vision", False)
 
+    # warmed contexts shared by the sub-agents of every iteration
+    context_pool = CustomBrowserContextPool(
+        browser,
+        config=CustomBrowserContextConfig(
+            # research agents only read text, skip images/media/fonts/trackers unless vision is on
+            lean_mode=kwargs.get("lean_mode", True),
+            allow_images=use_vision,
+        ),
+        size=max_query_num
+    )
+    warm_task = asyncio.create_task(context_pool.warm())
+    extraction_cache_dir = kwargs.get("extraction_cache_dir", None)
+    # extracted pages are shared by every sub-agent, optionally persisted across runs
+    # pages read by any sub-agent of the run, later visits reuse their extraction
+    url_registry = VisitedUrlRegistry()
+    controller = CustomController(
+        extraction_cache=ExtractionCache(persist_dir=extraction_cache_dir) if extraction_cache_dir else None,
+        url_registry=url_registry,
+    )
+
+    # how long the event loop gets blocked while the sub-agents run concurrently
+    loop_lag_monitor = LoopLagMonitor()
+    loop_lag_monitor.start()
+
+    # caps how many sub-agents browse at once, adapting to host memory and LLM latency
+    scheduler = QueryScheduler(
+        max_concurrency=kwargs.get("max_concurrent_agents", max_query_num),
+        max_queries_per_iteration=max_query_num,
+    )
+
+    # browser steps go to the agents still finding new information, stalled ones stop early
+    step_budget = StepBudgetController(
+        steps_per_query=kwargs.get("max_steps", 10),
+        max_steps_per_query=kwargs.get("max_steps_per_query", None),
+        max_iteration_steps=kwargs.get("max_iteration_steps", None),
+        iteration_time_budget=kwargs.get("iteration_time_budget", 900),
+        stall_steps=kwargs.get("stall_steps", 3),
+    )
+
+    async def ainvoke_llm(messages, kind: str = "report"):
+        start = time.perf_counter()
+        ai_msg = await llm.ainvoke(messages)
+        scheduler.observe_llm_latency(time.perf_counter() - start, kind)
+        return ai_msg
+
+    # on_progress(event, data) follows the run: "iteration", "query_done", "report_start",
+    # "report_section" and "report_chunk" events, so a UI can show results long before the report
+    on_progress = kwargs.get("on_progress", None)
+
+    def notify(event: str, **data):
+        if on_progress is None:
+            return
+        try:
+            on_progress(event, data)
+        except Exception as e:
+            logger.warning(f"Deep research progress callback failed on {event}: {e}")
+
+    async def astream_llm(messages):
+        """ainvoke_llm sending the content to on_progress as the tokens arrive"""
+        if on_progress is None:
+            return await ainvoke_llm(messages, "report")
+        start = time.perf_counter()
+        content, reasoning_content = "", ""
+        async for chunk in llm.astream(messages):
+            reasoning_content += chunk.additional_kwargs.get("reasoning_content") or ""
+            if isinstance(chunk.content, str) and chunk.content:
+                content += chunk.content
+                notify("report_chunk", text=chunk.content)
+        scheduler.observe_llm_latency(time.perf_counter() - start, "report")
+        if "</think>" in content:
+            # reasoning models served without a reasoning field inline it in the content
+            reasoning_content, content = content.split("</think>", 1)
+            reasoning_content = reasoning_content.replace("<think>", "")
+        if reasoning_content:
+            return AIMessage(content=content, reasoning_content=reasoning_content)
+        return AIMessage(content=content)
+
     history_query = []
-    history_infos = []
+    # each near duplicate query would cost a whole browser agent run
+    query_dedup = QueryDeduplicator()
+    # recorded information, prompts only get the entries related to what they work on
+    record_store = ResearchRecordStore()
+    record_token_budget = kwargs.get("record_token_budget", 2000)
+    planner_token_budget = kwargs.get("planner_token_budget", 4000)
+    # searched content excerpts added to the planner and recorder prompts
+    excerpt_token_budget = kwargs.get("excerpt_token_budget", 1000)
+    # agent runs queued or browsing -> (iteration, query index, query). Runs can outlive
+    # their iteration when planning starts before every result is in
+    running_agents: dict[asyncio.Task, tuple[int, int, str]] = {}
+    # share of an iteration's queries that must be recorded before the next planning starts
+    min_results_ratio = kwargs.get("min_results_ratio", 1.0)
+    query_result_dir = os.path.join(save_dir, "query_results")
+    os.makedirs(query_result_dir, exist_ok=True)
+    # BM25 index of the searched content (agent results and page extractions), kept with the run
+    content_index_path = os.path.join(save_dir, "search_index.json")
+    content_index = BM25Index.load(content_index_path) or BM25Index()
+
+    # continue a previous run of this save_dir, see resume_deep_research
+    checkpoint = kwargs.get("checkpoint", None)
+    searching_done = False
+    if checkpoint is not None:
+        search_iteration = checkpoint.search_iteration
+        history_query = list(checkpoint.history_query)
+        query_dedup.add(history_query)
+        record_store.add(checkpoint.records)
+        searching_done = checkpoint.searching_done
+        logger.info(
+            f"Resuming deep research after iteration {search_iteration}: {len(history_query)} queries, "
+            f"{len(record_store)} records, {len(checkpoint.pending_queries)} queries to search again"
+        )
+
+    def save_checkpoint():
+        ResearchCheckpoint(
+            task=task,
+            search_iteration=search_iteration,
+            history_query=history_query,
+            records=record_store.as_list(),
+            pending_queries=[list(query) for query in running_agents.values()],
+            searching_done=searching_done,
+        ).save(save_dir)
+
+    def save_content_index():
+        content_index.save(content_index_path)
+
+    add_infos = "1. Please click on the most relevant link to get information and go deeper, instead of just staying on the search page. \n" \
+                "2. When opening a PDF file, please remember to extract the content using extract_content instead of simply opening it for the user to view. \n" \
+                "3. When several search results look relevant, read them together with extract_urls_content instead of opening them one by one."
+
+    async def run_query_agent(iteration: int, i: int, query_task: str):
+        async with scheduler.slot((iteration, i)):
+            browser_context = await context_pool.acquire()
+            query_budget = step_budget.start(iteration)
+            agent_infos = add_infos
+            visited_urls = url_registry.recent(20)
+            if visited_urls:
+                agent_infos += "\n4. These pages were already read by other research agents, prefer other sources " \
+                               "(opening one of them returns its saved content): " + ", ".join(visited_urls)
+            try:
+                agent = CustomAgent(
+                    task=query_task,
+                    llm=llm,
+                    add_infos=agent_infos,
+                    browser=browser,
+                    browser_context=browser_context,
+                    use_vision=use_vision,
+                    system_prompt_class=CustomSystemPrompt,
+                    agent_prompt_class=CustomAgentMessagePrompt,
+                    max_actions_per_step=5,
+                    controller=controller,
+                    step_budget_callback=query_budget.after_step,
+                    llm_latency_callback=lambda seconds: scheduler.observe_llm_latency(seconds, "agent"),
+                )
+                return await agent.run(max_steps=query_budget.allowance)
+            finally:
+                step_budget.finish(query_budget)
+                if browser_context.config.lean_mode:
+                    logger.info(f"Lean mode: {browser_context.get_lean_stats()['total']}")
+                await context_pool.release(browser_context)
+
+    async def record_agent_result(agent_task: asyncio.Task) -> int:
+        """Record the result of a finished agent, returns the number of new entries"""
+        iteration, i, query_task = running_agents.pop(agent_task)
+        try:
+            agent_history = agent_task.result()
+            query_result = agent_history.final_result()
+        except Exception as e:
+            logger.error(f"Search agent of query {query_task} failed: {e}")
+            return 0
+        if not query_result:
+            logger.info(f"Search agent of query {query_task} finished without a result")
+            return 0
+        querr_save_path = os.path.join(query_result_dir, f"{iteration}-{i}.md")
+        logger.info(f"save query: {query_task} at {querr_save_path}")
+        with open(querr_save_path, "w", encoding="utf-8") as fw:
+            fw.write(f"Query: {query_task}\n")
+            fw.write(query_result)
+        # page extractions made along the way, not only the agent's final answer
+        for content in agent_history.extracted_content()[:-1]:
+            if len(content) > 500:
+                content_index.add(content, source=query_task)
+        content_index.add(query_result, source=query_task)
+        related_records = record_store.relevant(query_result, token_budget=record_token_budget)
+        # the pages of this query are already in the current results
+        related_excerpts = relevant_excerpts(content_index, query_result, excerpt_token_budget, exclude_source=query_task)
+        related_excerpts_ = "\n".join(f"- {excerpt}" for excerpt in related_excerpts)
+        record_prompt = f"User Instruction:{task}. \nPrevious Recorded Information:\n {record_store.format(related_records)} \n Current Search Results: {query_result}\n Related Searched Content:\n {related_excerpts_}\n "
+        logger.info(
+            f"Record prompt: ~{estimate_tokens(record_prompt)} tokens, "
+            f"{len(related_records)} of {len(record_store)} recorded entries, {len(related_excerpts)} excerpts"
+        )
+        record_messages.append(HumanMessage(content=record_prompt))
+        ai_record_msg = await ainvoke_llm(record_messages[:1] + record_messages[-1:], "recorder")
+        record_messages.append(ai_record_msg)
+        if hasattr(ai_record_msg, "reasoning_content"):
+            logger.info("🤯 Start Record Deep Thinking: ")
+            logger.info(ai_record_msg.reasoning_content)
+            logger.info("🤯 End Record Deep Thinking")
+        record_content = ai_record_msg.content
+        new_record_infos = await utils.arepair_json_loads(record_content)
+        if isinstance(new_record_infos, dict):
+            new_record_infos = [new_record_infos]
+        new_records = record_store.add(new_record_infos)
+        logger.info(f"Recorded {len(new_records)} new entries, {record_store.duplicates} duplicates skipped so far")
+        return len(new_records)
+
+    async def collect_agent_results(min_results: int) -> int:
+        """Record agent results in completion order while the other agents keep browsing"""
+        recorded = 0
+        while running_agents and recorded < min_results:
+            done, _ = await asyncio.wait(running_agents, return_when=asyncio.FIRST_COMPLETED)
+            for agent_task in done:
+                iteration, i, query_task = running_agents[agent_task]
+                new_records = await record_agent_result(agent_task)
+                save_checkpoint()
+                notify("query_done", iteration=iteration, index=i, query=query_task, new_records=new_records,
+                       total_records=len(record_store))
+                recorded += 1
+        return recorded
+
     try:
-        while search_iteration < max_search_iterations:
+        if checkpoint is not None and checkpoint.pending_queries:
+            # queries that were launched but not recorded when the previous run stopped
+            for iteration, i, query_task in checkpoint.pending_queries:
+                agent_task = asyncio.create_task(run_query_agent(iteration, i, query_task))
+                running_agents[agent_task] = (iteration, i, query_task)
+            await collect_agent_results(len(running_agents))
+
+        while not searching_done and search_iteration < max_search_iterations:
             search_iteration += 1
+            iteration_start = time.perf_counter()
             logger.info(f"Start {search_iteration}th Search...")
             history_query_ = json.dumps(history_query, indent=4)
-            history_infos_ = json.dumps(history_infos, indent=4)
-            query_prompt = f"This is search {search_iteration} of {max_search_iterations} maximum searches allowed.\n User Instruction:{task} \n Previous Queries:\n {history_query_} \n Previous Search Results:\n {history_infos_}\n"
+            history_infos_ = record_store.format(record_store.relevant(task, token_budget=planner_token_budget))
+            history_excerpts_ = "\n".join(f"- {excerpt}" for excerpt in relevant_excerpts(content_index, task, excerpt_token_budget))
+            query_prompt = f"This is search {search_iteration} of {max_search_iterations} maximum searches allowed.\n User Instruction:{task} \n Previous Queries:\n {history_query_} \n Previous Search Results:\n {history_infos_}\n Related Searched Content:\n {history_excerpts_}\n"
             search_messages.append(HumanMessage(content=query_prompt))
-            ai_query_msg = llm.invoke(search_messages[:1] + search_messages[1:][-1:])
+            ai_query_msg = await ainvoke_llm(search_messages[:1] + search_messages[1:][-1:], "planner")
             search_messages.append(ai_query_msg)
             if hasattr(ai_query_msg, "reasoning_content"):
                 logger.info("🤯 Start Search Deep Thinking: ")
                 logger.info(ai_query_msg.reasoning_content)
                 logger.info("🤯 End Search Deep Thinking")
             ai_query_content = ai_query_msg.content.replace("```json", "").replace("```", "")
-            ai_query_content = repair_json(ai_query_content)
-            ai_query_content = json.loads(ai_query_content)
+            ai_query_content = await utils.arepair_json_loads(ai_query_content)
             query_plan = ai_query_content["plan"]
             logger.info(f"Current Iteration {search_iteration} Planing:")
             logger.info(query_plan)
-            query_tasks = ai_query_content["queries"]
-            if not query_tasks:
+            planned_queries = ai_query_content["queries"]
+            if not planned_queries:
                 break
+            query_tasks = scheduler.select(query_dedup.filter(planned_queries))
+            if not query_tasks:
+                logger.info(f"Every query of iteration {search_iteration} was already searched")
+                continue
             else:
+                query_dedup.add(query_tasks)
                 history_query.extend(query_tasks)
                 logger.info("Query tasks:")
                 logger.info(query_tasks)
+                notify("iteration", iteration=search_iteration, max_iterations=max_search_iterations,
+                       plan=query_plan, queries=query_tasks)
 
             # 2. Perform Web Search and Auto exec
             # Paralle BU agents
-            add_infos = "1. Please click on the most relevant link to get information and go deeper, instead of just staying on the search page. \n" \
-                        "2. When opening a PDF file, please remember to extract the content using extract_content instead of simply opening it for the user to view."
-            agents = [CustomAgent(
-                task=task,
-                llm=llm,
-                add_infos=add_infos,
-                browser=browser,
-                use_vision=use_vision,
-                system_prompt_class=CustomSystemPrompt,
-                agent_prompt_class=CustomAgentMessagePrompt,
-                max_actions_per_step=5,
-                controller=controller
-            ) for task in query_tasks]
-            query_results = await asyncio.gather(*[agent.run(max_steps=kwargs.get("max_steps", 10)) for agent in agents])
-
-            # 3. Summarize Search Result
-            query_result_dir = os.path.join(save_dir, "query_results")
-            os.makedirs(query_result_dir, exist_ok=True)
-            for i in range(len(query_tasks)):
-                query_result = query_results[i].final_result()
-                querr_save_path = os.path.join(query_result_dir, f"{search_iteration}-{i}.md")
-                logger.info(f"save query: {query_tasks[i]} at {querr_save_path}")
-                with open(querr_save_path, "w", encoding="utf-8") as fw:
-                    fw.write(f"Query: {query_tasks[i]}\n")
-                    fw.write(query_result)
-                history_infos_ = json.dumps(history_infos, indent=4)
-                record_prompt = f"User Instruction:{task}. \nPrevious Recorded Information:\n {json.dumps(history_infos_)} \n Current Search Results: {query_result}\n "
-                record_messages.append(HumanMessage(content=record_prompt))
-                ai_record_msg = llm.invoke(record_messages[:1] + record_messages[-1:])
-                record_messages.append(ai_record_msg)
-                if hasattr(ai_record_msg, "reasoning_content"):
-                    logger.info("🤯 Start Record Deep Thinking: ")
-                    logger.info(ai_record_msg.reasoning_content)
-                    logger.info("🤯 End Record Deep Thinking")
-                record_content = ai_record_msg.content
-                record_content = repair_json(record_content)
-                new_record_infos = json.loads(record_content)
-                history_infos.extend(new_record_infos)
+            for i, query_task in enumerate(query_tasks):
+                agent_task = asyncio.create_task(run_query_agent(search_iteration, i, query_task))
+                running_agents[agent_task] = (search_iteration, i, query_task)
+            save_checkpoint()
+
+            # 3. Summarize Search Result, each one as soon as its agent is done
+            recorded = await collect_agent_results(math.ceil(len(query_tasks) * min_results_ratio))
+            logger.info(f"Browser context pool: {context_pool.stats.as_dict()}")
+            logger.info(
+                f"Iteration {search_iteration} took {time.perf_counter() - iteration_start:.1f}s: "
+                f"{recorded} results recorded, {len(running_agents)} agents still browsing"
+            )
+            save_checkpoint()
+            save_content_index()
+
+        # results of agents that outlived the last planning
+        await collect_agent_results(len(running_agents))
+        searching_done = True
+        save_checkpoint()
+        save_content_index()
+        logger.info(f"Search index: {len(content_index)} chunks saved at {content_index_path}")
 
         logger.info("\nFinish Searching, Start Generating Report...")
 
@@ -228,22 +460,48 @@ Provide your output as a JSON formatted list. Each item in the list must adhere
 
 1. **User Instruction:** The original instruction given by the user. This helps you determine what kind of information will be useful and how to structure your thinking.
 2. **Search Information:** Information gathered from the search queries.
+3. **Supporting Excerpts:** Excerpts of the searched pages most related to the user instruction, for details the recorded information left out.
         """
         
+        history_infos = record_store.as_list()
         history_infos_ = json.dumps(history_infos, indent=4)
         record_json_path = os.path.join(save_dir, "record_infos.json")
         logger.info(f"save All recorded information at {record_json_path}")
         with open(record_json_path, "w") as fw:
             json.dump(history_infos, fw, indent=4)
-        report_prompt = f"User Instruction:{task} \n Search Information:\n {history_infos_}"
-        report_messages = [SystemMessage(content=writer_system_prompt),
-                           HumanMessage(content=report_prompt)]  # New context for report generation
-        ai_report_msg = llm.invoke(report_messages)
-        if hasattr(ai_report_msg, "reasoning_content"):
-            logger.info("🤯 Start Report Deep Thinking: ")
-            logger.info(ai_report_msg.reasoning_content)
-            logger.info("🤯 End Report Deep Thinking")
-        report_content = ai_report_msg.content
+        report_start = time.perf_counter()
+        # "single" writes the report in one call, "map_reduce" drafts sections concurrently,
+        # "auto" switches to map_reduce when the records get too large for one call
+        report_mode = kwargs.get("report_mode", "auto")
+        report_token_budget = kwargs.get("report_token_budget", 12000)
+        if report_mode == "map_reduce" or (
+                report_mode == "auto" and estimate_tokens(history_infos_) > report_token_budget):
+            notify("report_start", mode="map_reduce", records=len(record_store))
+            report_writer = MapReduceReportWriter(
+                ainvoke_llm,
+                max_parallel_sections=kwargs.get("max_parallel_sections", 4),
+                section_token_budget=report_token_budget // 2,
+                content_index=content_index,
+                on_section=lambda draft: notify("report_section", content=draft),
+            )
+            report_content = await report_writer.write(task, record_store.records)
+        else:
+            # the records fit in one call, the rest of the budget goes to excerpts of the searched pages
+            report_excerpts = relevant_excerpts(
+                content_index, task, min(excerpt_token_budget * 3, report_token_budget - estimate_tokens(history_infos_))
+            )
+            report_excerpts_ = "\n".join(f"- {excerpt}" for excerpt in report_excerpts)
+            report_prompt = f"User Instruction:{task} \n Search Information:\n {history_infos_} \n Supporting Excerpts:\n {report_excerpts_}"
+            report_messages = [SystemMessage(content=writer_system_prompt),
+                               HumanMessage(content=report_prompt)]  # New context for report generation
+            notify("report_start", mode="single", records=len(record_store))
+            ai_report_msg = await astream_llm(report_messages)
+            if hasattr(ai_report_msg, "reasoning_content"):
+                logger.info("🤯 Start Report Deep Thinking: ")
+                logger.info(ai_report_msg.reasoning_content)
+                logger.info("🤯 End Report Deep Thinking")
+            report_content = ai_report_msg.content
+        logger.info(f"Report written in {time.perf_counter() - report_start:.1f}s ({report_mode} mode)")
 
         report_file_path = os.path.join(save_dir, "final_report.md")
         with open(report_file_path, "w", encoding="utf-8") as f:
@@ -255,6 +513,28 @@ Provide your output as a JSON formatted list. Each item in the list must adhere
         logger.error(f"Deep research Error: {e}")
         return "", None
     finally:
+        for agent_task in running_agents:
+            agent_task.cancel()
+        await asyncio.gather(*running_agents, return_exceptions=True)
+        logger.info(f"Query scheduler: {scheduler.stats.as_dict()}")
+        logger.info(f"Near duplicate queries skipped: {query_dedup.skipped}")
+        logger.info(f"Step budget: {step_budget.stats.as_dict()}")
+        logger.info(f"Visited urls: {len(url_registry)} pages, {url_registry.stats.as_dict()}")
+        warm_task.cancel()
+        await context_pool.close()
+        if browser.http_cache is not None:
+            logger.info(f"Http cache: {browser.http_cache.reset_stats().as_dict()}")
+        logger.info(f"Extraction cache: {controller.extraction_cache.stats.as_dict()}")
+        logger.info(f"Event loop lag: {(await loop_lag_monitor.stop()).as_dict()}")
         if browser:
             await browser.close()
-            logger.info("Browser closed.")
\ No newline at end of file
+            logger.info("Browser closed.")
+
+
+async def resume_deep_research(save_dir, llm, **kwargs):
+    """Continue the deep research saved in `save_dir` from its last checkpoint"""
+    checkpoint = ResearchCheckpoint.load(save_dir)
+    if checkpoint is None:
+        logger.error(f"No deep research checkpoint to resume in {save_dir}")
+        return "", None
+    return await deep_research(checkpoint.task, llm, save_dir=save_dir, checkpoint=checkpoint, **kwargs)
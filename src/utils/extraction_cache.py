@@ -0,0 +1,197 @@
+import hashlib
+import json
+import logging
+import os
+import time
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Optional
+from urllib.parse import parse_qsl, urlencode, urlsplit, urlunsplit
+
+logger = logging.getLogger(__name__)
+
+TRACKING_PARAMS = {"gclid", "fbclid", "msclkid", "yclid", "mc_cid", "mc_eid", "ref", "ref_src"}
+
+
+def canonicalize_url(url: str) -> str:
+    """Normalize a url so that the same page reached through different links maps to one key"""
+    parts = urlsplit(url.strip())
+    scheme = parts.scheme.lower()
+    host = (parts.hostname or "").lower()
+    if host.startswith("www."):
+        host = host[len("www."):]
+    port = parts.port
+    netloc = host if port is None or (scheme, port) in (("http", 80), ("https", 443)) else f"{host}:{port}"
+    path = parts.path or "/"
+    if len(path) > 1 and path.endswith("/"):
+        path = path.rstrip("/")
+    query = urlencode(sorted(
+        (key, value) for key, value in parse_qsl(parts.query, keep_blank_values=True)
+        if not key.lower().startswith("utm_") and key.lower() not in TRACKING_PARAMS
+    ))
+    return urlunsplit((scheme, netloc, path, query, ""))
+
+
+@dataclass
+class ExtractionCacheStats:
+    hits: int = 0
+    misses: int = 0
+    evictions: int = 0
+
+    @property
+    def hit_ratio(self) -> float:
+        lookups = self.hits + self.misses
+        return self.hits / lookups if lookups else 0.0
+
+    def as_dict(self) -> dict:
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_ratio": round(self.hit_ratio, 3),
+            "evictions": self.evictions,
+        }
+
+
+class ExtractionCache:
+    """
+    LRU cache of extracted page content keyed by canonical url, content hash and output
+    format, with a ttl. When `persist_dir` is set every entry is also written as a json file
+    so later processes can reuse it; the files are bounded by the same `max_entries` and ttl.
+    """
+
+    def __init__(self, max_entries: int = 512, ttl: float = 3600, persist_dir: Optional[str] = None):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.persist_dir = persist_dir
+        self.stats = ExtractionCacheStats()
+        # key -> (stored_at, content)
+        self._entries: OrderedDict[str, tuple[float, str]] = OrderedDict()
+        # canonical url -> output format and key of its latest extraction
+        self._latest: dict[str, tuple[str, str]] = {}
+        # key -> stored_at of the persisted entries, oldest first
+        self._persisted: OrderedDict[str, float] = OrderedDict()
+        if persist_dir:
+            os.makedirs(persist_dir, exist_ok=True)
+            self._load_persisted_index()
+
+    @staticmethod
+    def content_hash(content: str) -> str:
+        return hashlib.sha256(content.encode("utf-8", "surrogatepass")).hexdigest()
+
+    @staticmethod
+    def _key(canonical_url: str, content_hash: str, output_format: str) -> str:
+        return hashlib.sha256(f"{output_format}\n{canonical_url}\n{content_hash}".encode("utf-8")).hexdigest()
+
+    def _path(self, key: str) -> str:
+        return os.path.join(self.persist_dir, f"{key}.json")
+
+    def _load_persisted_index(self):
+        now = time.time()
+        files = []
+        for name in os.listdir(self.persist_dir):
+            if not name.endswith(".json"):
+                continue
+            key = name[:-len(".json")]
+            try:
+                # written once by put, the modification time is the storage time
+                stored_at = os.path.getmtime(self._path(key))
+            except OSError:
+                continue
+            if now - stored_at > self.ttl:
+                self._remove_persisted(key)
+                continue
+            files.append((stored_at, key))
+        for stored_at, key in sorted(files):
+            self._persisted[key] = stored_at
+        self._evict_persisted()
+
+    def _remove_persisted(self, key: str):
+        self._persisted.pop(key, None)
+        try:
+            os.remove(self._path(key))
+        except OSError:
+            pass
+
+    def _evict_persisted(self):
+        while len(self._persisted) > self.max_entries:
+            self._remove_persisted(next(iter(self._persisted)))
+
+    def _load_persisted(self, key: str) -> Optional[tuple[float, str]]:
+        if key not in self._persisted:
+            return None
+        try:
+            with open(self._path(key), "r", encoding="utf-8") as f:
+                entry = json.load(f)
+            return entry["stored_at"], entry["content"]
+        except (OSError, ValueError, KeyError):
+            return None
+
+    def _lookup(self, key: str) -> Optional[str]:
+        entry = self._entries.get(key) or self._load_persisted(key)
+        if entry is None:
+            return None
+        stored_at, content = entry
+        if time.time() - stored_at > self.ttl:
+            self._entries.pop(key, None)
+            if key in self._persisted:
+                self._remove_persisted(key)
+            return None
+        self._entries[key] = entry
+        self._entries.move_to_end(key)
+        if key in self._persisted:
+            self._persisted.move_to_end(key)
+        self._evict_entries()
+        return content
+
+    def _evict_entries(self):
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+            self.stats.evictions += 1
+
+    def get(self, url: str, content_hash: str, output_format: str) -> Optional[str]:
+        content = self._lookup(self._key(canonicalize_url(url), content_hash, output_format))
+        if content is None:
+            self.stats.misses += 1
+        else:
+            self.stats.hits += 1
+        return content
+
+    def get_latest(self, url: str, output_format: Optional[str] = None) -> Optional[str]:
+        """
+        Latest fresh extraction of a url whatever its content hash, None if it was made in another
+        `output_format` than the one given. Not counted in the stats.
+        """
+        latest = self._latest.get(canonicalize_url(url))
+        if latest is None or (output_format is not None and latest[0] != output_format):
+            return None
+        return self._lookup(latest[1])
+
+    def put(self, url: str, content_hash: str, output_format: str, content: str):
+        canonical_url = canonicalize_url(url)
+        key = self._key(canonical_url, content_hash, output_format)
+        entry = (time.time(), content)
+        self._entries[key] = entry
+        self._entries.move_to_end(key)
+        self._latest[canonical_url] = (output_format, key)
+        self._evict_entries()
+        if self.persist_dir and self.max_entries > 0:
+            try:
+                with open(self._path(key), "w", encoding="utf-8") as f:
+                    json.dump({"url": canonical_url, "stored_at": entry[0], "content": content}, f)
+            except OSError as e:
+                logger.debug(f"Failed to persist extraction of {url}: {e}")
+                return
+            self._persisted[key] = entry[0]
+            self._persisted.move_to_end(key)
+            self._evict_persisted()
+
+
+# shared by every controller (and so every agent) of the process
+_shared_extraction_cache: Optional[ExtractionCache] = None
+
+
+def get_shared_extraction_cache() -> ExtractionCache:
+    global _shared_extraction_cache
+    if _shared_extraction_cache is None:
+        _shared_extraction_cache = ExtractionCache()
+    return _shared_extraction_cache
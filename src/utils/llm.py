@@ -1,5 +1,10 @@
-from openai import OpenAI
+import asyncio
+import hashlib
 import pdb
+import weakref
+
+import httpx
+from openai import AsyncOpenAI, DefaultAsyncHttpxClient, DefaultHttpxClient, OpenAI
 from langchain_openai import ChatOpenAI
 from langchain_core.globals import get_llm_cache
 from langchain_core.language_models.base import (
@@ -10,6 +15,7 @@ from langchain_core.language_models.base import (
 from langchain_core.load import dumpd, dumps
 from langchain_core.messages import (
     AIMessage,
+    AIMessageChunk,
     SystemMessage,
     AnyMessage,
     BaseMessage,
@@ -33,6 +39,7 @@ from langchain_core.tools import BaseTool
 from typing import (
     TYPE_CHECKING,
     Any,
+    AsyncIterator,
     Callable,
     Literal,
     Optional,
@@ -40,15 +47,82 @@ from typing import (
     cast,
 )
 
+# one connection pool per endpoint and key, shared by every model instance using it
+HTTP_MAX_CONNECTIONS = 64
+HTTP_MAX_KEEPALIVE_CONNECTIONS = 16
+HTTP_KEEPALIVE_EXPIRY = 120.0
+HTTP_TIMEOUT = httpx.Timeout(600.0, connect=10.0)
+
+_openai_clients: dict[tuple[Optional[str], str], OpenAI] = {}
+# async connections belong to the event loop that opened them
+_async_openai_clients: "weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, dict]" = weakref.WeakKeyDictionary()
+
+
+def http_limits() -> httpx.Limits:
+    return httpx.Limits(
+        max_connections=HTTP_MAX_CONNECTIONS,
+        max_keepalive_connections=HTTP_MAX_KEEPALIVE_CONNECTIONS,
+        keepalive_expiry=HTTP_KEEPALIVE_EXPIRY,
+    )
+
+
+def _client_key(base_url: Optional[str], api_key: Optional[str]) -> tuple[Optional[str], str]:
+    return base_url, hashlib.sha256((api_key or "").encode("utf-8")).hexdigest()
+
+
+def get_openai_client(base_url: Optional[str], api_key: Optional[str]) -> OpenAI:
+    key = _client_key(base_url, api_key)
+    if key not in _openai_clients:
+        _openai_clients[key] = OpenAI(
+            base_url=base_url,
+            api_key=api_key,
+            http_client=DefaultHttpxClient(limits=http_limits(), timeout=HTTP_TIMEOUT),
+        )
+    return _openai_clients[key]
+
+
+def get_async_openai_client(base_url: Optional[str], api_key: Optional[str]) -> AsyncOpenAI:
+    clients = _async_openai_clients.setdefault(asyncio.get_running_loop(), {})
+    key = _client_key(base_url, api_key)
+    if key not in clients:
+        clients[key] = AsyncOpenAI(
+            base_url=base_url,
+            api_key=api_key,
+            http_client=DefaultAsyncHttpxClient(limits=http_limits(), timeout=HTTP_TIMEOUT),
+        )
+    return clients[key]
+
+
 class DeepSeekR1ChatOpenAI(ChatOpenAI):
-    
+    """deepseek-reasoner keeping the `reasoning_content` it returns next to the answer content"""
+
     def __init__(self, *args: Any, **kwargs: Any) -> None:
         super().__init__(*args, **kwargs)
-        self.client = OpenAI(
-            base_url=kwargs.get("base_url"),
-            api_key=kwargs.get("api_key")
-        ) 
-        
+        self.client = get_openai_client(self.openai_api_base, self._api_key())
+
+    def _api_key(self) -> Optional[str]:
+        return self.openai_api_key.get_secret_value() if self.openai_api_key else None
+
+    def _message_history(self, input: LanguageModelInput) -> list[dict]:
+        message_history = []
+        for input_ in self._convert_input(input).to_messages():
+            if isinstance(input_, SystemMessage):
+                message_history.append({"role": "system", "content": input_.content})
+            elif isinstance(input_, AIMessage):
+                message_history.append({"role": "assistant", "content": input_.content})
+            else:
+                message_history.append({"role": "user", "content": input_.content})
+        return message_history
+
+    def _request(self, input: LanguageModelInput, stop: Optional[list[str]] = None, **kwargs: Any) -> dict:
+        request = {"model": self.model_name, "messages": self._message_history(input)}
+        if stop:
+            request["stop"] = stop
+        if self.max_tokens:
+            request["max_tokens"] = self.max_tokens
+        request.update(kwargs)
+        return request
+
     async def ainvoke(
         self,
         input: LanguageModelInput,
@@ -57,24 +131,36 @@ class DeepSeekR1ChatOpenAI(ChatOpenAI):
         stop: Optional[list[str]] = None,
         **kwargs: Any,
     ) -> AIMessage:
-        message_history = []
-        for input_ in input:
-            if isinstance(input_, SystemMessage):
-                message_history.append({"role": "system", "content": input_.content})
-            elif isinstance(input_, AIMessage):
-                message_history.append({"role": "assistant", "content": input_.content})
-            else:
-                message_history.append({"role": "user", "content": input_.content})
-        
-        response = self.client.chat.completions.create(
-            model=self.model_name,
-            messages=messages
-        )
+        client = get_async_openai_client(self.openai_api_base, self._api_key())
+        response = await client.chat.completions.create(**self._request(input, stop, **kwargs))
 
-        reasoning_content = response.choices[0].message.reasoning_content
-        content = response.choices[0].message.content
+        reasoning_content = getattr(response.choices[0].message, "reasoning_content", None) or ""
+        content = response.choices[0].message.content or ""
         return AIMessage(content=content, reasoning_content=reasoning_content)
-    
+
+    async def astream(
+        self,
+        input: LanguageModelInput,
+        config: Optional[RunnableConfig] = None,
+        *,
+        stop: Optional[list[str]] = None,
+        **kwargs: Any,
+    ) -> AsyncIterator[AIMessageChunk]:
+        """Stream the answer, each chunk carries the reasoning tokens in additional_kwargs["reasoning_content"]"""
+        client = get_async_openai_client(self.openai_api_base, self._api_key())
+        stream = await client.chat.completions.create(**self._request(input, stop, stream=True, **kwargs))
+        async for chunk in stream:
+            if not chunk.choices:
+                continue
+            delta = chunk.choices[0].delta
+            reasoning_content = getattr(delta, "reasoning_content", None)
+            if not delta.content and not reasoning_content:
+                continue
+            yield AIMessageChunk(
+                content=delta.content or "",
+                additional_kwargs={"reasoning_content": reasoning_content} if reasoning_content else {},
+            )
+
     def invoke(
         self,
         input: LanguageModelInput,
@@ -83,22 +169,10 @@ class DeepSeekR1ChatOpenAI(ChatOpenAI):
         stop: Optional[list[str]] = None,
         **kwargs: Any,
     ) -> AIMessage:
-        message_history = []
-        for input_ in input:
-            if isinstance(input_, SystemMessage):
-                message_history.append({"role": "system", "content": input_.content})
-            elif isinstance(input_, AIMessage):
-                message_history.append({"role": "assistant", "content": input_.content})
-            else:
-                message_history.append({"role": "user", "content": input_.content})
-        
-        response = self.client.chat.completions.create(
-            model=self.model_name,
-            messages=message_history
-        )
+        response = self.client.chat.completions.create(**self._request(input, stop, **kwargs))
 
-        reasoning_content = response.choices[0].message.reasoning_content
-        content = response.choices[0].message.content
+        reasoning_content = getattr(response.choices[0].message, "reasoning_content", None) or ""
+        content = response.choices[0].message.content or ""
         return AIMessage(content=content, reasoning_content=reasoning_content)
     
 class DeepSeekR1ChatOllama(ChatOllama):
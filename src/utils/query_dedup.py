@@ -0,0 +1,75 @@
+import logging
+import re
+
+from src.utils.bm25_index import STOPWORDS
+
+logger = logging.getLogger(__name__)
+
+WORD_PATTERN = re.compile(r"\w+", re.UNICODE)
+QUERY_STOPWORDS = STOPWORDS | {"a", "an", "of", "in", "on", "to", "at", "by", "or", "is", "vs"}
+
+
+def _stem(token: str) -> str:
+    # plural folding is enough for search queries
+    if len(token) > 3 and token.endswith("s") and not token.endswith("ss"):
+        return token[:-1]
+    return token
+
+
+def query_tokens(query: str) -> frozenset[str]:
+    words = WORD_PATTERN.findall(query.lower())
+    return frozenset(_stem(word) for word in words if word not in QUERY_STOPWORDS) or frozenset(words)
+
+
+def char_ngrams(query: str, n: int = 3) -> frozenset[str]:
+    text = " ".join(WORD_PATTERN.findall(query.lower()))
+    if len(text) <= n:
+        return frozenset([text])
+    return frozenset(text[i:i + n] for i in range(len(text) - n + 1))
+
+
+def jaccard(a: frozenset, b: frozenset) -> float:
+    if not a or not b:
+        return 0.0
+    return len(a & b) / len(a | b)
+
+
+class QueryDeduplicator:
+    """
+    Drops planner queries that are near duplicates of an already searched query or of another
+    query of the same batch: same word set up to `token_threshold` jaccard similarity, or same
+    spelling up to `ngram_threshold` character trigram similarity.
+    """
+
+    def __init__(self, token_threshold: float = 0.8, ngram_threshold: float = 0.85):
+        self.token_threshold = token_threshold
+        self.ngram_threshold = ngram_threshold
+        self.skipped = 0
+        self._seen: list[tuple[str, frozenset[str], frozenset[str]]] = []
+
+    def _duplicate_of(self, query: str, seen: list[tuple[str, frozenset[str], frozenset[str]]]) -> str | None:
+        tokens, ngrams = query_tokens(query), char_ngrams(query)
+        for other, other_tokens, other_ngrams in seen:
+            if (jaccard(tokens, other_tokens) >= self.token_threshold
+                    or jaccard(ngrams, other_ngrams) >= self.ngram_threshold):
+                return other
+        return None
+
+    def filter(self, queries: list[str]) -> list[str]:
+        """Queries of the batch that are neither searched already nor repeated in the batch"""
+        kept = []
+        batch: list[tuple[str, frozenset[str], frozenset[str]]] = []
+        for query in queries:
+            duplicate_of = self._duplicate_of(query, self._seen + batch)
+            if duplicate_of is not None:
+                self.skipped += 1
+                logger.info(f"Skipping query {query!r}, near duplicate of {duplicate_of!r}")
+                continue
+            kept.append(query)
+            batch.append((query, query_tokens(query), char_ngrams(query)))
+        return kept
+
+    def add(self, queries: list[str]):
+        """Remember queries that were actually searched"""
+        for query in queries:
+            self._seen.append((query, query_tokens(query), char_ngrams(query)))
@@ -0,0 +1,171 @@
+import asyncio
+import heapq
+import itertools
+import logging
+import time
+from contextlib import asynccontextmanager
+from dataclasses import dataclass, field
+from typing import Optional
+
+logger = logging.getLogger(__name__)
+
+
+def memory_info_mb() -> Optional[tuple[float, float]]:
+    """(total, available) host memory from /proc/meminfo, None where it is not available"""
+    try:
+        with open("/proc/meminfo", "r") as f:
+            values = {line.split(":")[0]: float(line.split()[1]) / 1024 for line in f}
+        return values["MemTotal"], values["MemAvailable"]
+    except (OSError, KeyError, ValueError, IndexError):
+        return None
+
+
+@dataclass
+class SchedulerStats:
+    started: int = 0
+    completed: int = 0
+    failed: int = 0
+    dropped: int = 0
+    peak_concurrency: int = 0
+    peak_memory_used_mb: float = 0.0
+    llm_latency_ewma: float = 0.0
+    started_at: float = field(default_factory=time.monotonic)
+
+    @property
+    def throughput_per_min(self) -> float:
+        elapsed = time.monotonic() - self.started_at
+        return self.completed * 60 / elapsed if elapsed > 0 else 0.0
+
+    def as_dict(self) -> dict:
+        return {
+            "started": self.started,
+            "completed": self.completed,
+            "failed": self.failed,
+            "dropped": self.dropped,
+            "peak_concurrency": self.peak_concurrency,
+            "peak_memory_used_mb": round(self.peak_memory_used_mb, 1),
+            "llm_latency_ewma_s": round(self.llm_latency_ewma, 2),
+            "queries_per_min": round(self.throughput_per_min, 2),
+        }
+
+
+@dataclass
+class LatencyBaseline:
+    """
+    Recent latency of one kind of LLM call against its baseline, a low quantile of the
+    latencies: it follows faster calls quickly and creeps up by `baseline_decay` of the gap
+    on slower ones, so a lasting slowdown becomes the new norm after a while.
+    """
+
+    ewma: float = 0.0
+    baseline: Optional[float] = None
+
+    def observe(self, seconds: float, baseline_decay: float):
+        if self.baseline is None:
+            self.ewma = self.baseline = seconds
+            return
+        self.ewma = 0.8 * self.ewma + 0.2 * seconds
+        rate = 0.3 if seconds < self.baseline else baseline_decay
+        self.baseline += rate * (seconds - self.baseline)
+
+    @property
+    def slowdown(self) -> float:
+        return self.ewma / self.baseline if self.baseline else 1.0
+
+
+class QueryScheduler:
+    """
+    Runs research queries under a concurrency limit, highest priority (planner order) first.
+    The limit moves between 1 and `max_concurrency`: it drops by one when host memory gets
+    below `min_available_memory_mb` or the LLM latency rises over `latency_slowdown` times
+    its baseline, and grows back by one while neither happens. Latency is tracked per kind
+    of call (planner, recorder, agent steps...) since their prompt sizes differ a lot.
+    """
+
+    def __init__(
+            self,
+            max_concurrency: int = 3,
+            max_queries_per_iteration: int = 3,
+            min_available_memory_mb: float = 1024,
+            latency_slowdown: float = 2.0,
+            baseline_decay: float = 0.05,
+    ):
+        self.max_concurrency = max(1, max_concurrency)
+        self.max_queries_per_iteration = max_queries_per_iteration
+        self.min_available_memory_mb = min_available_memory_mb
+        self.latency_slowdown = latency_slowdown
+        self.baseline_decay = baseline_decay
+        self.limit = self.max_concurrency
+        self.stats = SchedulerStats()
+        self._active = 0
+        self._waiting: list[tuple[tuple, int]] = []
+        self._counter = itertools.count()
+        self._condition = asyncio.Condition()
+        self._latencies: dict[str, LatencyBaseline] = {}
+
+    def select(self, queries: list[str]) -> list[str]:
+        """Keep the first queries of the planner up to the per iteration limit"""
+        if len(queries) > self.max_queries_per_iteration:
+            self.stats.dropped += len(queries) - self.max_queries_per_iteration
+            logger.info(f"Planner returned {len(queries)} queries, keeping the first {self.max_queries_per_iteration}")
+        return queries[:self.max_queries_per_iteration]
+
+    def observe_llm_latency(self, seconds: float, kind: str = "default"):
+        self._latencies.setdefault(kind, LatencyBaseline()).observe(seconds, self.baseline_decay)
+        if self.stats.llm_latency_ewma == 0.0:
+            self.stats.llm_latency_ewma = seconds
+        else:
+            self.stats.llm_latency_ewma = 0.7 * self.stats.llm_latency_ewma + 0.3 * seconds
+
+    def _adapt(self):
+        memory = memory_info_mb()
+        low_memory = False
+        if memory is not None:
+            total, available = memory
+            self.stats.peak_memory_used_mb = max(self.stats.peak_memory_used_mb, total - available)
+            low_memory = available < self.min_available_memory_mb
+        slow_llm = any(latency.slowdown > self.latency_slowdown for latency in self._latencies.values())
+        if low_memory or slow_llm:
+            limit = max(1, min(self.limit, self._active) - 1)
+            if limit < self.limit:
+                logger.info(
+                    f"Lowering query concurrency to {limit} "
+                    f"({'low host memory' if low_memory else 'slow LLM responses'})"
+                )
+            self.limit = limit
+        elif self.limit < self.max_concurrency:
+            self.limit += 1
+
+    @asynccontextmanager
+    async def slot(self, priority: tuple):
+        """Wait for a free slot; lower `priority` tuples are served first"""
+        entry = (priority, next(self._counter))
+        async with self._condition:
+            heapq.heappush(self._waiting, entry)
+            self._adapt()
+            try:
+                await self._condition.wait_for(lambda: self._active < self.limit and self._waiting[0] == entry)
+            except BaseException:
+                # cancelled while queued, let the next query through
+                self._waiting.remove(entry)
+                heapq.heapify(self._waiting)
+                self._condition.notify_all()
+                raise
+            heapq.heappop(self._waiting)
+            self._active += 1
+            self.stats.started += 1
+            self.stats.peak_concurrency = max(self.stats.peak_concurrency, self._active)
+            self._condition.notify_all()
+        succeeded = False
+        try:
+            yield
+            succeeded = True
+        finally:
+            async with self._condition:
+                self._active -= 1
+                if succeeded:
+                    self.stats.completed += 1
+                else:
+                    self.stats.failed += 1
+                self._adapt()
+                self._condition.notify_all()
@@ -0,0 +1,172 @@
+import asyncio
+import logging
+import re
+from dataclasses import dataclass, field
+from typing import Awaitable, Callable, Optional
+
+from langchain.schema import HumanMessage, SystemMessage
+
+from src.utils.bm25_index import BM25Index, tokenize
+from src.utils.research_store import ResearchRecord, estimate_tokens
+
+logger = logging.getLogger(__name__)
+
+CITATION_PATTERN = re.compile(r"\[(\d+)\]")
+
+SECTION_SYSTEM_PROMPT = """
+You are a professional report writer drafting **one section** of a larger Markdown research report.
+
+**Instructions:**
+
+*   Start with a `##` heading that names the topic of the section, then write well-structured paragraphs (and a Markdown table when comparing data) using only the provided information.
+*   Preserve key data and figures.
+*   Cite sources with the bracketed numbers given in the information (e.g., [3]). Never invent new numbers and do not add a reference list.
+*   Supporting excerpts, when given, are raw text from the searched pages: use them to check and complete figures, but cite the numbered sources.
+*   Do not write a report title, introduction or conclusion, other sections take care of them.
+*   Output only the Markdown of the section.
+"""
+
+FRAME_SYSTEM_PROMPT = """
+You are a professional report writer finishing a Markdown research report whose body sections are already written.
+
+Write the report title (`#` heading) and a compelling introduction, then the marker line `<<SECTIONS>>`, then a `##` conclusion that summarizes the key takeaways. Use only the section excerpts you are given, do not add citations or a reference list. Output only the Markdown.
+"""
+
+
+@dataclass
+class ReportSection:
+    records: list[ResearchRecord] = field(default_factory=list)
+    terms: set[str] = field(default_factory=set)
+    tokens: int = 0
+
+    def add(self, record: ResearchRecord, terms: set[str], tokens: int):
+        self.records.append(record)
+        self.terms |= terms
+        self.tokens += tokens
+
+
+def cluster_records(
+        records: list[ResearchRecord],
+        section_token_budget: int = 6000,
+        min_overlap: float = 0.3,
+) -> list[ReportSection]:
+    """
+    Greedy lexical clustering: a record joins the section sharing the largest share of its
+    terms (title, summary and the recorder's note on where it belongs in the report) while
+    the section stays within `section_token_budget`.
+    """
+    sections: list[ReportSection] = []
+    for record in records:
+        terms = set(tokenize(f"{record.title} {record.summary_content} {record.thinking}"))
+        tokens = estimate_tokens(record.compact())
+        best, best_overlap = None, min_overlap
+        for section in sections:
+            if section.tokens + tokens > section_token_budget or not terms:
+                continue
+            overlap = len(terms & section.terms) / len(terms)
+            if overlap >= best_overlap:
+                best, best_overlap = section, overlap
+        if best is None:
+            best = ReportSection()
+            sections.append(best)
+        best.add(record, terms, tokens)
+    return sections
+
+
+class MapReduceReportWriter:
+    """
+    Writes a report too large for one LLM call: records are clustered into sections, the
+    sections are drafted concurrently (at most `max_parallel_sections` calls at once), then a
+    small call writes the title, introduction and conclusion around them and the reference list
+    is built from the sources the drafts actually cite.
+    """
+
+    def __init__(
+            self,
+            ainvoke: Callable[[list], Awaitable],
+            max_parallel_sections: int = 4,
+            section_token_budget: int = 6000,
+            content_index: Optional[BM25Index] = None,
+            excerpts_per_section: int = 3,
+            on_section: Optional[Callable[[str], None]] = None,
+    ):
+        self.ainvoke = ainvoke
+        self.max_parallel_sections = max_parallel_sections
+        self.section_token_budget = section_token_budget
+        # raw searched content, each section also gets its best matching chunks
+        self.content_index = content_index
+        self.excerpts_per_section = excerpts_per_section
+        # called with each section draft as soon as it is written, e.g. to preview the report
+        self.on_section = on_section
+
+    async def write(self, task: str, records: list[ResearchRecord]) -> str:
+        # one number per unique source, shared by every section so drafts need no renumbering
+        source_numbers: dict[str, int] = {}
+        sources: list[ResearchRecord] = []
+        for record in records:
+            if record.url != "unknown" and record.url not in source_numbers:
+                source_numbers[record.url] = len(sources) + 1
+                sources.append(record)
+
+        sections = cluster_records(records, section_token_budget=self.section_token_budget)
+        logger.info(f"Writing the report in {len(sections)} sections from {len(records)} records")
+        semaphore = asyncio.Semaphore(self.max_parallel_sections)
+
+        async def draft(section: ReportSection) -> str:
+            information = "\n".join(
+                f"[{source_numbers[record.url]}] {record.title}: {record.summary_content}"
+                if record.url in source_numbers else f"(no source) {record.summary_content}"
+                for record in section.records
+            )
+            if self.content_index is not None and self.excerpts_per_section:
+                excerpts = self.content_index.search(
+                    " ".join(record.summary_content for record in section.records), k=self.excerpts_per_section
+                )
+                if excerpts:
+                    information += "\n Supporting Excerpts:\n" + "\n".join(f"- {chunk.text}" for _, chunk in excerpts)
+            async with semaphore:
+                ai_msg = await self.ainvoke([
+                    SystemMessage(content=SECTION_SYSTEM_PROMPT),
+                    HumanMessage(content=f"User Instruction:{task} \n Section Information:\n {information}"),
+                ])
+            content = ai_msg.content.strip()
+            if self.on_section is not None:
+                self.on_section(content)
+            return content
+
+        drafts = await asyncio.gather(*[draft(section) for section in sections])
+
+        excerpts = "\n\n".join(draft_content[:600] for draft_content in drafts)
+        ai_frame_msg = await self.ainvoke([
+            SystemMessage(content=FRAME_SYSTEM_PROMPT),
+            HumanMessage(content=f"User Instruction:{task} \n Section Excerpts:\n {excerpts}"),
+        ])
+        frame = ai_frame_msg.content.strip()
+        body = "\n\n".join(drafts)
+        if "<<SECTIONS>>" in frame:
+            report = frame.replace("<<SECTIONS>>", body, 1)
+        else:
+            report = f"{frame}\n\n{body}"
+        return self._number_references(report, sources)
+
+    @staticmethod
+    def _number_references(report: str, sources: list[ResearchRecord]) -> str:
+        """Renumber the cited sources in order of first citation and append the reference list"""
+        renumbered: dict[int, int] = {}
+        for match in CITATION_PATTERN.finditer(report):
+            number = int(match.group(1))
+            if 1 <= number <= len(sources) and number not in renumbered:
+                renumbered[number] = len(renumbered) + 1
+
+        def replace(match: re.Match) -> str:
+            number = int(match.group(1))
+            return f"[{renumbered[number]}]" if number in renumbered else match.group(0)
+
+        report = CITATION_PATTERN.sub(replace, report)
+        if not renumbered:
+            return report
+        references = "\n\n".join(
+            f"[{new}] {sources[old - 1].title} ({sources[old - 1].url})"
+            for old, new in sorted(renumbered.items(), key=lambda item: item[1])
+        )
+        return f"{report}\n\n## References\n\n{references}\n"
@@ -0,0 +1,42 @@
+import json
+import logging
+import os
+from dataclasses import asdict, dataclass, field
+from typing import Optional
+
+logger = logging.getLogger(__name__)
+
+CHECKPOINT_FILE = "checkpoint.json"
+
+
+@dataclass
+class ResearchCheckpoint:
+    """Progress of a deep research run, enough to continue it without redoing finished work"""
+
+    task: str
+    search_iteration: int = 0
+    history_query: list[str] = field(default_factory=list)
+    records: list[dict] = field(default_factory=list)
+    # [iteration, query index, query] of the queries launched but not recorded yet
+    pending_queries: list[list] = field(default_factory=list)
+    searching_done: bool = False
+
+    def save(self, save_dir: str):
+        path = os.path.join(save_dir, CHECKPOINT_FILE)
+        tmp_path = f"{path}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(asdict(self), f, indent=4)
+        # a crash while writing never leaves a truncated checkpoint behind
+        os.replace(tmp_path, path)
+
+    @classmethod
+    def load(cls, save_dir: str) -> Optional["ResearchCheckpoint"]:
+        path = os.path.join(save_dir, CHECKPOINT_FILE)
+        if not os.path.exists(path):
+            return None
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                return cls(**json.load(f))
+        except (OSError, ValueError, TypeError) as e:
+            logger.warning(f"Failed to load research checkpoint {path}: {e}")
+            return None
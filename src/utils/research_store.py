@@ -0,0 +1,108 @@
+import hashlib
+from dataclasses import asdict, dataclass
+from typing import Iterable, Optional
+
+from src.utils.bm25_index import BM25Index
+from src.utils.extraction_cache import canonicalize_url
+
+
+def estimate_tokens(text: str) -> int:
+    """Rough LLM token count, about 4 characters per token"""
+    return len(text) // 4 + 1
+
+
+def relevant_excerpts(index: BM25Index, text: str, token_budget: int = 1000,
+                      exclude_source: Optional[str] = None) -> list[str]:
+    """Chunks of the searched content index best matching `text`, best first, within `token_budget`"""
+    selected, used = [], 0
+    for _, chunk in index.search(text, k=None):
+        if exclude_source is not None and chunk.source == exclude_source:
+            continue
+        cost = estimate_tokens(chunk.text)
+        if used + cost > token_budget:
+            continue
+        selected.append(chunk.text)
+        used += cost
+    return selected
+
+
+@dataclass
+class ResearchRecord:
+    url: str
+    title: str
+    summary_content: str
+    thinking: str = ""
+
+    @property
+    def content_hash(self) -> str:
+        normalized = " ".join(self.summary_content.lower().split())
+        return hashlib.sha256(normalized.encode("utf-8")).hexdigest()
+
+    def compact(self) -> str:
+        return f"- {self.title} ({self.url}): {self.summary_content}"
+
+
+class ResearchRecordStore:
+    """
+    Recorded research information as normalized (url, title, summary) entries. The same summary
+    of the same page (canonical url) is stored once, and prompts get the entries most related
+    to a text (BM25 ranked) within a token budget instead of the whole history.
+    """
+
+    def __init__(self, records: Optional[Iterable[dict]] = None):
+        self.records: list[ResearchRecord] = []
+        self._keys: set[tuple[str, str]] = set()
+        # long summaries span several chunks, each chunk keeps the position of its record
+        self.index = BM25Index(chunk_words=10_000)
+        self.duplicates = 0
+        if records:
+            self.add(records)
+
+    def __len__(self) -> int:
+        return len(self.records)
+
+    def add(self, records: Iterable[dict]) -> list[ResearchRecord]:
+        """Add the recorder output, returns the entries that were new"""
+        added = []
+        for item in records:
+            if not isinstance(item, dict) or not item.get("summary_content"):
+                continue
+            url = str(item.get("url") or "unknown")
+            record = ResearchRecord(
+                url=url if url == "unknown" else canonicalize_url(url),
+                title=str(item.get("title") or "unknown"),
+                summary_content=str(item["summary_content"]),
+                thinking=str(item.get("thinking") or ""),
+            )
+            key = (record.url, record.content_hash)
+            if key in self._keys:
+                self.duplicates += 1
+                continue
+            self._keys.add(key)
+            self.records.append(record)
+            self.index.add(f"{record.title} {record.summary_content}", record=len(self.records) - 1)
+            added.append(record)
+        return added
+
+    def relevant(self, text: str, token_budget: int = 2000) -> list[ResearchRecord]:
+        """Entries best matching `text`, best first, within `token_budget`"""
+        selected, used, seen = [], 0, set()
+        for _, chunk in self.index.search(text, k=None):
+            position = chunk.metadata["record"]
+            if position in seen:
+                continue
+            seen.add(position)
+            record = self.records[position]
+            cost = estimate_tokens(record.compact())
+            if used + cost > token_budget:
+                continue
+            selected.append(record)
+            used += cost
+        return selected
+
+    @staticmethod
+    def format(records: list[ResearchRecord]) -> str:
+        return "\n".join(record.compact() for record in records)
+
+    def as_list(self) -> list[dict]:
+        return [asdict(record) for record in self.records]
@@ -0,0 +1,175 @@
+import hashlib
+import logging
+import time
+from dataclasses import dataclass, field
+from typing import Optional
+
+from browser_use.agent.views import ActionResult
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass
+class StepBudgetStats:
+    agents: int = 0
+    steps: int = 0
+    steps_granted: int = 0
+    steps_returned: int = 0
+    stopped_stalled: int = 0
+    stopped_out_of_time: int = 0
+    browser_seconds: float = 0.0
+
+    def as_dict(self) -> dict:
+        return {
+            "agents": self.agents,
+            "steps": self.steps,
+            "extra_steps_granted": self.steps_granted,
+            "unused_steps_returned": self.steps_returned,
+            "stopped_stalled": self.stopped_stalled,
+            "stopped_out_of_time": self.stopped_out_of_time,
+            "browser_minutes": round(self.browser_seconds / 60, 2),
+        }
+
+
+@dataclass
+class IterationBudget:
+    total_steps: int = 0
+    # steps promised to the agents of the iteration, used or not
+    allocated_steps: int = 0
+    deadline: Optional[float] = None
+
+    @property
+    def spare_steps(self) -> int:
+        return self.total_steps - self.allocated_steps
+
+
+@dataclass
+class QueryStepBudget:
+    """Step allowance of one research agent, see StepBudgetController"""
+
+    controller: "StepBudgetController"
+    iteration: int
+    allowance: int
+    # steps granted at start, the iteration deadline never cuts an agent below them
+    base_allowance: int = 0
+    steps: int = 0
+    steps_since_gain: int = 0
+    gains: int = 0
+    memory_length: int = 0
+    started_at: float = field(default_factory=time.monotonic)
+
+    def after_step(self, step: int, results: list[ActionResult], memory: str) -> int:
+        """CustomAgent step budget callback, returns how many steps the agent may take in total"""
+        return self.controller.after_step(self, step, results, memory)
+
+
+class StepBudgetController:
+    """
+    Shares the browser steps of a research iteration between its agents by information gain.
+    Each agent starts with `steps_per_query` steps and a step gains when it extracts content no
+    agent of the run has seen yet or adds to the agent's memory. An agent without gain for
+    `stall_steps` steps is stopped, its unused steps go back to the iteration, and an agent still
+    gaining at the end of its allowance borrows them, up to `max_steps_per_query`. Once
+    `iteration_time_budget` seconds have passed since the first agent of the iteration started,
+    no more steps are lent and agents past their starting allowance stop; agents that waited
+    for a scheduler slot still get their own starting steps.
+    """
+
+    def __init__(
+            self,
+            steps_per_query: int = 10,
+            max_steps_per_query: Optional[int] = None,
+            max_iteration_steps: Optional[int] = None,
+            iteration_time_budget: Optional[float] = None,
+            stall_steps: int = 3,
+            min_steps: int = 2,
+            min_content_length: int = 200,
+    ):
+        self.steps_per_query = steps_per_query
+        self.max_steps_per_query = max_steps_per_query or steps_per_query * 2
+        self.max_iteration_steps = max_iteration_steps
+        self.iteration_time_budget = iteration_time_budget
+        self.stall_steps = stall_steps
+        self.min_steps = min_steps
+        # shorter results are navigation or click messages, not information
+        self.min_content_length = min_content_length
+        self.stats = StepBudgetStats()
+        self._iterations: dict[int, IterationBudget] = {}
+        self._seen_content: set[str] = set()
+
+    def start(self, iteration: int) -> QueryStepBudget:
+        """Budget of an agent starting on a query of `iteration`"""
+        iteration_budget = self._iterations.setdefault(iteration, IterationBudget())
+        if iteration_budget.deadline is None and self.iteration_time_budget:
+            iteration_budget.deadline = time.monotonic() + self.iteration_time_budget
+        iteration_budget.total_steps += self.steps_per_query
+        if self.max_iteration_steps is not None:
+            iteration_budget.total_steps = min(iteration_budget.total_steps, self.max_iteration_steps)
+        allowance = max(1, min(self.steps_per_query, iteration_budget.spare_steps))
+        iteration_budget.allocated_steps += allowance
+        self.stats.agents += 1
+        return QueryStepBudget(controller=self, iteration=iteration, allowance=allowance, base_allowance=allowance)
+
+    def _gain(self, budget: QueryStepBudget, results: list[ActionResult], memory: str) -> int:
+        gain = 0
+        for result in results:
+            content = result.extracted_content
+            if result.error or not content or len(content) < self.min_content_length:
+                continue
+            content_hash = hashlib.sha256(" ".join(content.split()).encode("utf-8")).hexdigest()
+            if content_hash not in self._seen_content:
+                self._seen_content.add(content_hash)
+                gain += 1
+        if len(memory) > budget.memory_length:
+            budget.memory_length = len(memory)
+            gain += 1
+        return gain
+
+    def after_step(self, budget: QueryStepBudget, step: int, results: list[ActionResult], memory: str) -> int:
+        iteration_budget = self._iterations[budget.iteration]
+        budget.steps = step
+        self.stats.steps += 1
+        gain = self._gain(budget, results or [], memory or "")
+        budget.gains += gain
+        budget.steps_since_gain = 0 if gain else budget.steps_since_gain + 1
+
+        out_of_time = iteration_budget.deadline is not None and time.monotonic() > iteration_budget.deadline
+        if out_of_time and step >= budget.base_allowance:
+            if budget.allowance > step:
+                logger.info(f"Iteration {budget.iteration} is out of time, stopping its agent after {step} steps")
+                self.stats.stopped_out_of_time += 1
+            return self._cut(budget, iteration_budget)
+        if step >= self.min_steps and budget.steps_since_gain >= self.stall_steps:
+            logger.info(f"No new information in the last {budget.steps_since_gain} steps, stopping the agent after {step} steps")
+            self.stats.stopped_stalled += 1
+            return self._cut(budget, iteration_budget)
+        if step >= budget.allowance and budget.steps_since_gain == 0:
+            # still finding new information, borrow steps the stopped agents left
+            extra = min(
+                iteration_budget.spare_steps,
+                self.max_steps_per_query - budget.allowance,
+                max(1, self.steps_per_query // 4),
+            )
+            if extra > 0:
+                budget.allowance += extra
+                iteration_budget.allocated_steps += extra
+                self.stats.steps_granted += extra
+                logger.info(f"Agent still gaining information, {extra} more steps (now {budget.allowance})")
+        return budget.allowance
+
+    def _cut(self, budget: QueryStepBudget, iteration_budget: IterationBudget) -> int:
+        self._return_unused(budget, iteration_budget)
+        budget.allowance = budget.steps
+        return budget.allowance
+
+    def _return_unused(self, budget: QueryStepBudget, iteration_budget: IterationBudget):
+        unused = budget.allowance - budget.steps
+        if unused > 0:
+            iteration_budget.allocated_steps -= unused
+            self.stats.steps_returned += unused
+            budget.allowance = budget.steps
+
+    def finish(self, budget: QueryStepBudget):
+        """The agent is done, its unused steps can go to the other agents of the iteration"""
+        self._return_unused(budget, self._iterations[budget.iteration])
+        self.stats.browser_seconds += time.monotonic() - budget.started_at
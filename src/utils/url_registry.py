@@ -0,0 +1,61 @@
+from dataclasses import dataclass
+
+from src.utils.extraction_cache import canonicalize_url
+
+
+@dataclass
+class UrlRegistryStats:
+    visits: int = 0
+    duplicate_visits: int = 0
+    reused: int = 0
+
+    def as_dict(self) -> dict:
+        return {
+            "visits": self.visits,
+            "duplicate_visits": self.duplicate_visits,
+            "reused_extractions": self.reused,
+        }
+
+
+class VisitedUrlRegistry:
+    """
+    Pages read by the agents of one research run, keyed by canonical url. An agent opening a
+    page another agent already read is offered the cached extraction once; if it opens the
+    page again it is really navigated.
+    """
+
+    def __init__(self):
+        self.stats = UrlRegistryStats()
+        # canonical url -> ids of the visitors (agents, see CustomBrowserContext.visitor_id) that loaded it, in visit order
+        self._visitors: dict[str, list[str]] = {}
+        self._offered: set[tuple[str, str]] = set()
+
+    def __len__(self) -> int:
+        return len(self._visitors)
+
+    def mark_visited(self, url: str, visitor: str):
+        if not url.startswith("http"):
+            return
+        visitors = self._visitors.setdefault(canonicalize_url(url), [])
+        if visitor in visitors:
+            return
+        if visitors:
+            self.stats.duplicate_visits += 1
+        visitors.append(visitor)
+        self.stats.visits += 1
+
+    def visited_by_other(self, url: str, visitor: str) -> bool:
+        visitors = self._visitors.get(canonicalize_url(url), [])
+        return any(other != visitor for other in visitors)
+
+    def offer_cached(self, url: str, visitor: str) -> bool:
+        """True the first time `visitor` opens a page another visitor already read"""
+        key = (canonicalize_url(url), visitor)
+        if key in self._offered or not self.visited_by_other(url, visitor):
+            return False
+        self._offered.add(key)
+        self.stats.reused += 1
+        return True
+
+    def recent(self, limit: int = 20) -> list[str]:
+        return list(self._visitors)[-limit:]
@@ -1,18 +1,27 @@
+import asyncio
 import base64
+import hashlib
+import json
 import os
 import time
+import weakref
 from pathlib import Path
-from typing import Dict, Optional
+from typing import Dict, Optional, Tuple
 import requests
 
 from langchain_anthropic import ChatAnthropic
+from langchain_core.language_models.chat_models import BaseChatModel
 from langchain_mistralai import ChatMistralAI
 from langchain_google_genai import ChatGoogleGenerativeAI
 from langchain_ollama import ChatOllama
 from langchain_openai import AzureChatOpenAI, ChatOpenAI
+from openai import DefaultAsyncHttpxClient, DefaultHttpxClient
 import gradio as gr
+from json_repair import repair_json
 
-from .llm import DeepSeekR1ChatOpenAI, DeepSeekR1ChatOllama
+from .cpu_pool import get_cpu_pool
+from .llm import (HTTP_TIMEOUT, DeepSeekR1ChatOllama, DeepSeekR1ChatOpenAI,
+                  http_limits)
 
 PROVIDER_DISPLAY_NAMES = {
     "openai": "OpenAI",
@@ -22,9 +31,18 @@ PROVIDER_DISPLAY_NAMES = {
     "gemini": "Gemini"
 }
 
+# long-lived LLM clients by (provider, base_url, api key hash, model, options), each keeps its
+# http connection pool warm for the next runs. Kept per event loop: async connections belong
+# to the loop that opened them
+_llm_clients: "weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, Dict[Tuple, BaseChatModel]]" = weakref.WeakKeyDictionary()
+
+
 def get_llm_model(provider: str, **kwargs):
     """
     获取LLM 模型
+    Models with the same provider, endpoint, key, model name and options share one client per
+    event loop; every call gets a copy with its own temperature that reuses the client's
+    connections. Outside of a running loop a new client is built every time.
     :param provider: 模型类型
     :param kwargs:
     :return:
@@ -36,6 +54,39 @@ def get_llm_model(provider: str, **kwargs):
             handle_api_key_error(provider, env_var)
         kwargs["api_key"] = api_key
 
+    options = tuple(sorted(
+        (name, repr(value)) for name, value in kwargs.items()
+        if name not in ("api_key", "base_url", "model_name", "temperature")
+    ))
+    key = (
+        provider,
+        kwargs.get("base_url", ""),
+        hashlib.sha256((kwargs.get("api_key") or "").encode("utf-8")).hexdigest(),
+        kwargs.get("model_name", ""),
+        options,
+    )
+    try:
+        clients = _llm_clients.setdefault(asyncio.get_running_loop(), {})
+    except RuntimeError:
+        return _create_llm_model(provider, **kwargs)
+    if key not in clients:
+        clients[key] = _create_llm_model(provider, **kwargs)
+        _build_lazy_clients(clients[key])
+    # a shallow copy shares the client objects, only the temperature differs
+    return clients[key].model_copy(update={"temperature": kwargs.get("temperature", 0.0)})
+
+
+def _build_lazy_clients(llm: BaseChatModel):
+    """Create the clients some models only build on first use, so that their copies share them"""
+    if isinstance(llm, ChatAnthropic):
+        _ = llm._client, llm._async_client
+    elif isinstance(llm, ChatGoogleGenerativeAI):
+        # built only while an event loop is running
+        _ = llm.async_client
+
+
+def _create_llm_model(provider: str, **kwargs):
+    api_key = kwargs.get("api_key", "")
     if provider == "anthropic":
         if not kwargs.get("base_url", ""):
             base_url = "https://api.anthropic.com"
@@ -75,6 +126,7 @@ def get_llm_model(provider: str, **kwargs):
             temperature=kwargs.get("temperature", 0.0),
             base_url=base_url,
             api_key=api_key,
+            **_openai_http_clients(),
         )
     elif provider == "deepseek":
         if not kwargs.get("base_url", ""):
@@ -95,6 +147,7 @@ def get_llm_model(provider: str, **kwargs):
                 temperature=kwargs.get("temperature", 0.0),
                 base_url=base_url,
                 api_key=api_key,
+                **_openai_http_clients(),
             )
     elif provider == "gemini":
         return ChatGoogleGenerativeAI(
@@ -134,10 +187,20 @@ def get_llm_model(provider: str, **kwargs):
             api_version="2024-05-01-preview",
             azure_endpoint=base_url,
             api_key=api_key,
+            **_openai_http_clients(),
         )
     else:
         raise ValueError(f"Unsupported provider: {provider}")
-    
+
+
+def _openai_http_clients() -> dict:
+    """http clients of an openai compatible model, sized for concurrent research agents"""
+    return {
+        "http_client": DefaultHttpxClient(limits=http_limits(), timeout=HTTP_TIMEOUT),
+        "http_async_client": DefaultAsyncHttpxClient(limits=http_limits(), timeout=HTTP_TIMEOUT),
+    }
+
+
 # Predefined model names for common providers
 model_names = {
     "anthropic": ["claude-3-5-sonnet-20240620", "claude-3-opus-20240229"],
@@ -184,6 +247,22 @@ def encode_image(img_path):
     return image_data
 
 
+def repair_json_loads(content: str):
+    """Parse json returned by a LLM, repairing it first when it is malformed"""
+    try:
+        return json.loads(content)
+    except json.JSONDecodeError:
+        return json.loads(repair_json(content))
+
+
+async def arepair_json_loads(content: str):
+    """repair_json_loads that runs the (pure python, slow) repair in the shared cpu pool"""
+    try:
+        return json.loads(content)
+    except json.JSONDecodeError:
+        return await get_cpu_pool().run_in_process(repair_json_loads, content)
+
+
 def get_latest_files(directory: str, file_types: list = ['.webm', '.zip']) -> Dict[str, Optional[str]]:
     """Get the latest recording and trace files"""
     latest_files: Dict[str, Optional[str]] = {ext: None for ext in file_types}
@@ -204,39 +283,3 @@ def get_latest_files(directory: str, file_types: list = ['.webm', '.zip']) -> Di
             print(f"Error getting latest {file_type} file: {e}")
             
     return latest_files
-async def capture_screenshot(browser_context):
-    """Capture and encode a screenshot"""
-    # Extract the Playwright browser instance
-    playwright_browser = browser_context.browser.playwright_browser  # Ensure this is correct.
-
-    # Check if the browser instance is valid and if an existing context can be reused
-    if playwright_browser and playwright_browser.contexts:
-        playwright_context = playwright_browser.contexts[0]
-    else:
-        return None
-
-    # Access pages in the context
-    pages = None
-    if playwright_context:
-        pages = playwright_context.pages
-
-    # Use an existing page or create a new one if none exist
-    if pages:
-        active_page = pages[0]
-        for page in pages:
-            if page.url != "about:blank":
-                active_page = page
-    else:
-        return None
-
-    # Take screenshot
-    try:
-        screenshot = await active_page.screenshot(
-            type='jpeg',
-            quality=75,
-            scale="css"
-        )
-        encoded = base64.b64encode(screenshot).decode('utf-8')
-        return encoded
-    except Exception as e:
-        return None
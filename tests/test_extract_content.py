@@ -0,0 +1,92 @@
+import pdb
+
+from dotenv import load_dotenv
+
+load_dotenv()
+import sys
+
+sys.path.append(".")
+import asyncio
+import os
+import tempfile
+import threading
+import time
+from functools import partial
+from http.server import SimpleHTTPRequestHandler, ThreadingHTTPServer
+
+
+def _write_fixture_site(root: str, n_paragraphs: int = 300):
+    paragraphs = "\n".join(
+        f"<p>Paragraph {i}: browser agents read the main content of this article, "
+        f"not the navigation, ads or footer. <a href='/page{i}.html'>link {i}</a></p>"
+        for i in range(n_paragraphs)
+    )
+    html = f"""<html><head><title>Fixture article</title></head><body>
+    <nav>{' '.join(f"<a href='/nav{i}'>nav {i}</a>" for i in range(50))}</nav>
+    <article><h1>Fixture article</h1>{paragraphs}</article>
+    <footer>footer</footer></body></html>"""
+    with open(os.path.join(root, "article.html"), "w", encoding="utf-8") as f:
+        f.write(html)
+
+
+def _serve(root: str) -> ThreadingHTTPServer:
+    handler = partial(SimpleHTTPRequestHandler, directory=root)
+    server = ThreadingHTTPServer(("127.0.0.1", 0), handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+async def benchmark_extract_content(rounds: int = 10):
+    """
+    Extraction latency on a local fixture site: the previous reader round trip
+    (navigate away, extract on the loop, go back) against extract_content on the loaded DOM.
+    The jina service cannot reach localhost, so the old path navigates to the fixture itself,
+    which is a lower bound of its real cost. Needs the playwright chromium, run it as a script:
+    python tests/test_extract_content.py
+    """
+    from browser_use.browser.browser import Browser, BrowserConfig
+    from main_content_extractor import MainContentExtractor
+
+    from src.controller.custom_controller import CustomController
+    from src.utils.extraction_cache import ExtractionCache
+
+    root = tempfile.mkdtemp()
+    _write_fixture_site(root)
+    server = _serve(root)
+    url = f"http://127.0.0.1:{server.server_address[1]}/article.html"
+
+    browser = Browser(config=BrowserConfig(headless=True, disable_security=True))
+    browser_context = await browser.new_context()
+    # no caching, every round measures a real extraction of the loaded DOM
+    controller = CustomController(extraction_cache=ExtractionCache(max_entries=0))
+    ExtractAction = controller.registry.create_action_model()
+    try:
+        page = await browser_context.get_current_page()
+        await page.goto(url)
+
+        start = time.perf_counter()
+        for _ in range(rounds):
+            await page.goto(url + "?reader=1")
+            MainContentExtractor.extract(html=await page.content(), output_format="markdown")
+            await page.go_back()
+        old_ms = (time.perf_counter() - start) * 1000 / rounds
+
+        # the first extraction starts the worker process, a long running agent pays it once
+        await controller.act(ExtractAction(extract_content={"include_links": True}), browser_context)
+        start = time.perf_counter()
+        for _ in range(rounds):
+            result = await controller.act(
+                ExtractAction(extract_content={"include_links": True}), browser_context
+            )
+        new_ms = (time.perf_counter() - start) * 1000 / rounds
+
+        assert "Fixture article" in result.extracted_content
+        print(f"reader round trip: {old_ms:.1f} ms / extraction, in-DOM extraction: {new_ms:.1f} ms / extraction")
+    finally:
+        await browser_context.close()
+        await browser.close()
+        server.shutdown()
+
+
+if __name__ == "__main__":
+    asyncio.run(benchmark_extract_content())
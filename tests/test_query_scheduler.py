@@ -0,0 +1,58 @@
+import sys
+
+sys.path.append(".")
+import random
+
+from src.utils.query_scheduler import QueryScheduler
+
+
+def _scheduler(max_concurrency: int = 3) -> QueryScheduler:
+    # host memory is not under test here
+    scheduler = QueryScheduler(max_concurrency=max_concurrency, min_available_memory_mb=0)
+    scheduler._active = max_concurrency
+    return scheduler
+
+
+def _research_iteration(scheduler: QueryScheduler, rng: random.Random, slowdown: float = 1.0) -> int:
+    """
+    LLM calls of one iteration: a planner call, then agent steps and a recorder call per
+    query. Returns the lowest concurrency limit of the iteration.
+    """
+    lowest = scheduler.limit
+    calls = [("planner", 4.0)]
+    for _ in range(3):
+        calls += [("agent", rng.uniform(3.0, 15.0)) for _ in range(8)]
+        calls.append(("recorder", rng.uniform(11.0, 13.0)))
+    for kind, seconds in calls:
+        scheduler.observe_llm_latency(seconds * slowdown, kind)
+        scheduler._adapt()
+        lowest = min(lowest, scheduler.limit)
+    return lowest
+
+
+def test_adapt_keeps_concurrency_with_mixed_prompt_sizes():
+    scheduler = _scheduler()
+    rng = random.Random(0)
+    for _ in range(10):
+        assert _research_iteration(scheduler, rng) == scheduler.max_concurrency
+
+
+def test_adapt_lowers_concurrency_on_slowdown_and_recovers():
+    scheduler = _scheduler()
+    rng = random.Random(1)
+    for _ in range(5):
+        _research_iteration(scheduler, rng)
+    assert scheduler.limit == scheduler.max_concurrency
+
+    lowest = min(_research_iteration(scheduler, rng, slowdown=3.0) for _ in range(2))
+    assert lowest < scheduler.max_concurrency
+
+    # the slower latency becomes the new baseline
+    for _ in range(10):
+        _research_iteration(scheduler, rng, slowdown=3.0)
+    assert scheduler.limit == scheduler.max_concurrency
+
+
+if __name__ == "__main__":
+    test_adapt_keeps_concurrency_with_mixed_prompt_sizes()
+    test_adapt_lowers_concurrency_on_slowdown_and_recovers()
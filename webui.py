@@ -27,7 +27,10 @@ from src.agent.custom_prompts import (CustomAgentMessagePrompt,
                                       CustomSystemPrompt)
 from src.browser.custom_browser import CustomBrowser
 from src.browser.custom_context import (BrowserContextConfig,
-                                        CustomBrowserContext)
+                                        CustomBrowserContext,
+                                        CustomBrowserContextConfig)
+from src.browser.http_cache import get_shared_http_cache
+from src.browser.screencast import PageScreencast
 from src.controller.custom_controller import CustomController
 from src.utils import utils
 from src.utils.agent_state import AgentState
@@ -36,8 +39,7 @@ from src.utils.default_config_settings import (default_config,
                                                save_config_to_file,
                                                save_current_config,
                                                update_ui_from_config)
-from src.utils.utils import (capture_screenshot, get_latest_files,
-                             update_model_dropdown)
+from src.utils.utils import get_latest_files, update_model_dropdown
 
 # Global variables for persistence
 _global_browser = None
@@ -46,6 +48,11 @@ _global_browser_context = None
 # Create the global agent state instance
 _global_agent_state = AgentState()
 
+def get_http_cache():
+    """On-disk response cache shared by every browser of the web UI, if HTTP_CACHE_DIR is set"""
+    cache_dir = os.getenv("HTTP_CACHE_DIR", "")
+    return get_shared_http_cache(cache_dir) if cache_dir else None
+
 async def stop_agent():
     """Request the agent to stop and update UI with enhanced feedback"""
     global _global_agent_state, _global_browser_context, _global_browser
@@ -352,18 +359,21 @@ async def run_custom_agent(
                     disable_security=disable_security,
                     chrome_instance_path=chrome_path,
                     extra_chromium_args=extra_chromium_args,
-                )
+                ),
+                http_cache=get_http_cache(),
             )
 
         if _global_browser_context is None:
             _global_browser_context = await _global_browser.new_context(
-                config=BrowserContextConfig(
+                config=CustomBrowserContextConfig(
                     trace_path=save_trace_path if save_trace_path else None,
                     save_recording_path=save_recording_path if save_recording_path else None,
                     no_viewport=False,
                     browser_window_size=BrowserContextWindowSize(
                         width=window_w, height=window_h
                     ),
+                    # reuse logins of previous successful runs
+                    storage_state_account=None if use_own_browser else os.getenv("STORAGE_STATE_ACCOUNT") or None,
                 )
             )
             
@@ -393,6 +403,9 @@ async def run_custom_agent(
         model_thoughts = history.model_thoughts()
 
         trace_file = get_latest_files(save_trace_path)        
+        http_cache = getattr(_global_browser, "http_cache", None)
+        if http_cache is not None:
+            logger.info(f"Http cache: {http_cache.reset_stats().as_dict()}")
 
         return final_result, errors, model_actions, model_thoughts, trace_file.get('.zip'), history_file
     except Exception as e:
@@ -518,51 +531,93 @@ async def run_with_stream(
                 history
             ]
             now = _global_agent_state.now
-            # Periodically update the stream while the agent task is running
-            while not agent_task.done():
-                try:
-                    encoded_screenshot = await capture_screenshot(_global_browser_context)
-                    
-                    if encoded_screenshot is not None:
-                        html_content = f'<img src="data:image/jpeg;base64,{encoded_screenshot}" style="width:{stream_vw}vw; height:{stream_vh}vh ; border:1px solid #ccc;">'
+            waiting_html = f"<h1 style='width:{stream_vw}vw; height:{stream_vh}vh'>Waiting for browser session...</h1>"
+            screencast = None
+            shown_frame_seq = 0
+            # Stream screencast frames while the agent task is running, an idle page sends no frames
+            try:
+                while not agent_task.done():
+                    changed = False
+                    try:
+                        browser_context = _global_browser_context
+                        if browser_context is None or browser_context.session is None:
+                            changed = html_content != waiting_html
+                            html_content = waiting_html
+                            await asyncio.sleep(0.2)
+                        else:
+                            # agent step screenshots and screencast frames share the context's frame bus
+                            frame_bus = getattr(browser_context, "frame_bus", None)
+                            page = getattr(browser_context, "active_page", None) or browser_context.session.current_page
+                            if screencast is None or screencast.page is not page:
+                                # the agent switched tabs, follow the new page
+                                if screencast is not None:
+                                    await screencast.stop()
+                                screencast = PageScreencast(page, max_width=window_w, max_height=window_h,
+                                                            frame_bus=frame_bus)
+                                await screencast.start()
+                            data_url = None
+                            if frame_bus is not None:
+                                frame = await frame_bus.wait_for_frame(after_seq=shown_frame_seq, timeout=0.5)
+                                if frame is not None:
+                                    shown_frame_seq = frame.seq
+                                    data_url = frame.data_url
+                            else:
+                                frame_data = await screencast.next_frame(timeout=0.5)
+                                if frame_data is not None:
+                                    data_url = f"data:image/jpeg;base64,{frame_data}"
+                            if data_url is not None:
+                                html_content = f'<img src="{data_url}" style="width:{stream_vw}vw; height:{stream_vh}vh ; border:1px solid #ccc;">'
+                                changed = True
+                    except Exception as e:
+                        logger.debug(f"Live view unavailable: {e}")
+                        if screencast is not None:
+                            await screencast.stop()
+                        screencast = None
+                        changed = html_content != waiting_html
+                        html_content = waiting_html
+                        await asyncio.sleep(0.2)
+
+                    if _global_agent_state and _global_agent_state.is_stop_requested():
+                        history.append({"role": "assistant", "content": "Stop requested - the agent will halt at the next safe point"})
+                        yield [
+                            html_content,
+                            final_result,
+                            errors,
+                            model_actions,
+                            model_thoughts,
+                            latest_videos,
+                            trace,
+                            history_file,
+                            gr.update(value="Stopping...", interactive=False),  # stop_button
+                            gr.update(interactive=False),  # run_button
+                            history
+                        ]
+                        break
                     else:
-                        html_content = f"<h1 style='width:{stream_vw}vw; height:{stream_vh}vh'>Waiting for browser session...</h1>"
-                except Exception as e:
-                    html_content = f"<h1 style='width:{stream_vw}vw; height:{stream_vh}vh'>Waiting for browser session...</h1>"
-
-                if _global_agent_state and _global_agent_state.is_stop_requested():
-                    history.append({"role": "assistant", "content": "Stop requested - the agent will halt at the next safe point"})
-                    yield [
-                        html_content,
-                        final_result,
-                        errors,
-                        model_actions,
-                        model_thoughts,
-                        latest_videos,
-                        trace,
-                        history_file,
-                        gr.update(value="Stopping...", interactive=False),  # stop_button
-                        gr.update(interactive=False),  # run_button
-                        history
-                    ]
-                    break
-                else:
-                    if _global_agent_state.will_update_model_thinking(now):
-                        history.append({"role": "assistant", "content": _global_agent_state.get_model_thinking()})
-                    yield [
-                        html_content,
-                        final_result,
-                        errors,
-                        model_actions,
-                        model_thoughts,
-                        latest_videos,
-                        trace,
-                        history_file,
-                        gr.update(value="Stop", interactive=True),  # Re-enable stop button
-                        gr.update(interactive=True),  # Re-enable run button
-                        history
-                    ]
-                await asyncio.sleep(0.05)
+                        if _global_agent_state.will_update_model_thinking(now):
+                            now = _global_agent_state.now
+                            history.append({"role": "assistant", "content": _global_agent_state.get_model_thinking()})
+                            changed = True
+                        if not changed:
+                            continue
+                        yield [
+                            html_content,
+                            final_result,
+                            errors,
+                            model_actions,
+                            model_thoughts,
+                            latest_videos,
+                            trace,
+                            history_file,
+                            gr.update(value="Stop", interactive=True),  # Re-enable stop button
+                            gr.update(interactive=True),  # Re-enable run button
+                            history
+                        ]
+            finally:
+                # also when gradio cancels the stream, an attached screencast keeps publishing frames
+                if screencast is not None:
+                    await screencast.stop()
+                    logger.info(f"Live view screencast: {screencast.stats.as_dict()}")
 
             # Once the agent task completes, get the results
             try:
@@ -633,9 +688,25 @@ async def close_global_browser():
         await _global_browser.close()
         _global_browser = None
         
+def format_deep_search_progress(research_task, iterations, report_preview=""):
+    """Markdown of the research run so far: planned queries with their state, then the report preview"""
+    lines = [f"## 🧐 {research_task}"]
+    for iteration in iterations:
+        lines.append(f"\n**Iteration {iteration['iteration']}/{iteration['max_iterations']}** - {iteration['plan']}")
+        for query, new_records in iteration["queries"].items():
+            if new_records is None:
+                lines.append(f"- ⏳ {query}")
+            else:
+                lines.append(f"- ✅ {query} ({new_records} new records)")
+    if report_preview:
+        lines.append(f"\n---\n\n{report_preview}")
+    return "\n".join(lines)
+
+
 async def run_deep_search(research_task, max_search_iteration_input, max_query_per_iter_input, llm_provider, llm_model_name, llm_temperature, llm_base_url, llm_api_key, use_vision, headless):
+    """Run the deep research, yielding (markdown, report file, research button) as the research progresses"""
     from src.utils.deep_research import deep_research
-    
+
     llm = utils.get_llm_model(
             provider=llm_provider,
             model_name=llm_model_name,
@@ -643,13 +714,60 @@ async def run_deep_search(research_task, max_search_iteration_input, max_query_p
             base_url=llm_base_url,
             api_key=llm_api_key,
         )
-    markdown_content, file_path = await deep_research(research_task, llm, 
-                                                        max_search_iterations=max_search_iteration_input,
-                                                        max_query_num=max_query_per_iter_input,
-                                                        use_vision=use_vision,
-                                                        headless=headless)
-    return markdown_content, file_path
-    
+    events = asyncio.Queue()
+    research = asyncio.create_task(deep_research(research_task, llm,
+                                                 max_search_iterations=int(max_search_iteration_input),
+                                                 max_query_num=int(max_query_per_iter_input),
+                                                 use_vision=use_vision,
+                                                 headless=headless,
+                                                 http_cache=get_http_cache(),
+                                                 on_progress=lambda event, data: events.put_nowait((event, data))))
+    iterations = []
+    report_preview = ""
+    yield format_deep_search_progress(research_task, iterations, "Planning the first queries..."), None, gr.update(interactive=False)
+    try:
+        while not research.done() or not events.empty():
+            get_event = asyncio.ensure_future(events.get())
+            await asyncio.wait([get_event, research], return_when=asyncio.FIRST_COMPLETED)
+            if not get_event.done():
+                get_event.cancel()
+                continue
+            pending = [get_event.result()]
+            # batch the events already queued, streamed tokens arrive much faster than the UI refreshes
+            while not events.empty():
+                pending.append(events.get_nowait())
+            for event, data in pending:
+                if event == "iteration":
+                    iterations.append({
+                        "iteration": data["iteration"],
+                        "max_iterations": data["max_iterations"],
+                        "plan": data["plan"],
+                        "queries": {query: None for query in data["queries"]},
+                    })
+                elif event == "query_done":
+                    for iteration in iterations:
+                        if iteration["iteration"] == data["iteration"]:
+                            iteration["queries"][data["query"]] = data["new_records"]
+                elif event == "report_start":
+                    report_preview = f"*Writing the report from {data['records']} records...*\n\n"
+                elif event == "report_section":
+                    report_preview += data["content"] + "\n\n"
+                elif event == "report_chunk":
+                    report_preview += data["text"]
+            yield format_deep_search_progress(research_task, iterations, report_preview), None, gr.update(interactive=False)
+
+        markdown_content, file_path = research.result()
+        if not file_path:
+            markdown_content = format_deep_search_progress(
+                research_task, iterations, "**Deep research failed, see the logs for details.**"
+            )
+        yield markdown_content, file_path, gr.update(interactive=True)
+    finally:
+        # the UI stopped listening (stop button or closed page), stop the browser agents too
+        if not research.done():
+            research.cancel()
+            await asyncio.gather(research, return_exceptions=True)
+
 
 def create_ui(config, theme_name="Ocean"):
     css = """
@@ -730,6 +848,18 @@ def create_ui(config, theme_name="Ocean"):
                                 value="<h1 style='width:100vh; height:68vh'>Waiting for browser session...</h1>",
                                 label="Live Browser View",
                             )
+                with gr.TabItem("🧐 Deep Research", id=8):
+                    research_task_input = gr.Textbox(label="Research Task", lines=5,
+                                                     placeholder="Enter your research topic...")
+                    with gr.Row():
+                        max_search_iteration_input = gr.Number(label="Max Search Iteration", value=3, precision=0)
+                        max_query_per_iter_input = gr.Number(label="Max Query per Iteration", value=1, precision=0)
+                    with gr.Row():
+                        research_button = gr.Button("▶️ Run Deep Research", variant="primary", scale=2)
+                        research_stop_button = gr.Button("⏹️ Stop", variant="stop", scale=1)
+                    markdown_output_display = gr.Markdown(label="Research Report")
+                    markdown_download = gr.File(label="Download Research Report")
+
                 with gr.TabItem("📊 Results", id=6):
                     with gr.Group():
                         with gr.Row(equal_height=True):
@@ -975,6 +1105,23 @@ def create_ui(config, theme_name="Ocean"):
                                 ],
                             )
 
+                            # Deep research streams its progress and report, stop cancels the run
+                            research_event = research_button.click(
+                                fn=run_deep_search,
+                                inputs=[
+                                    research_task_input, max_search_iteration_input, max_query_per_iter_input,
+                                    llm_provider, llm_model_name, llm_temperature, llm_base_url, llm_api_key,
+                                    use_vision, headless,
+                                ],
+                                outputs=[markdown_output_display, markdown_download, research_button],
+                            )
+                            research_stop_button.click(
+                                fn=lambda: gr.update(interactive=True),
+                                inputs=[],
+                                outputs=[research_button],
+                                cancels=[research_event],
+                            )
+
                         with gr.TabItem("🎥 Recordings", id=7):
                             def list_recordings(save_recording_path):
                                 if not os.path.exists(save_recording_path):
@@ -1029,15 +1176,19 @@ def create_ui(config, theme_name="Ocean"):
     return demo
 
 
-parser = argparse.ArgumentParser(description="Gradio UI for Browser Agent")
-parser.add_argument("--ip", type=str, default="127.0.0.1", help="IP address to bind to")
-parser.add_argument("--port", type=int, default=7788, help="Port to listen on")
-parser.add_argument("--theme", type=str, default="Ocean", choices=theme_map.keys(), help="Theme to use for the UI")
-parser.add_argument("--dark-mode", action="store_true", help="Enable dark mode")
-args = parser.parse_args()
+def main():
+    parser = argparse.ArgumentParser(description="Gradio UI for Browser Agent")
+    parser.add_argument("--ip", type=str, default="127.0.0.1", help="IP address to bind to")
+    parser.add_argument("--port", type=int, default=7788, help="Port to listen on")
+    parser.add_argument("--theme", type=str, default="Ocean", choices=theme_map.keys(), help="Theme to use for the UI")
+    parser.add_argument("--dark-mode", action="store_true", help="Enable dark mode")
+    args = parser.parse_args()
+
+    config_dict = default_config()
+    demo = create_ui(config_dict, theme_name=args.theme)
+    demo.launch(server_name=args.ip, server_port=args.port)
 
-config_dict = default_config()
-demo = create_ui(config_dict, theme_name=args.theme)
 
+# cpu pool workers import this module again, the UI is only built in the main process
 if __name__ == '__main__':
-    demo.launch(server_name=args.ip, server_port=args.port)
\ No newline at end of file
+    main()
\ No newline at end of file